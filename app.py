@@ -1,6 +1,13 @@
 import gradio as gr
-from leichtesprache.core import simplify_text
-from leichtesprache.llm import list_local_models
+from leichtesprache.admission import (
+    AdmissionController,
+    QueueFullError,
+    QueueTimeoutError,
+    SlotGroup,
+)
+from leichtesprache.core import simplify_text_stream_async, simplify_text_chunked_stream_async
+from leichtesprache.llm import available_models, discover_models, warm_up
+from leichtesprache.metrics import start_metrics_server
 import leichtesprache.parameters as p
 
 
@@ -10,27 +17,103 @@ pinfo = {
     "Temp": "LLM Parameter. Higher values increase the randomness of the answer",
 }
 
-AVBL_LLMS = list_local_models()
-AVBL_LLM_CHOICES = sorted(list(set(p.LLM_CHOICES) & set(AVBL_LLMS)))
-DEFAULT_MODEL = p.MODEL if (p.MODEL in AVBL_LLMS) else (AVBL_LLM_CHOICES[0] if AVBL_LLM_CHOICES else None)
+
+async def simplify(
+    text: str,
+    llm: str,
+    use_rules: bool,
+    split_paragraphs: bool,
+    top_k: int,
+    top_p: float,
+    temp: float,
+):
+    """
+    Stream the simplified text into the output box as it is generated.
+
+    Requests wait for a free generation slot of the model first (see AdmissionController),
+    showing their position in the queue, and are rejected if the queue is full. Paragraphs are
+    only simplified in parallel as far as further slots are free (see SlotGroup).
+    """
+    try:
+        ticket = admission.enter(llm)
+    except QueueFullError as e:
+        raise gr.Error(str(e))
+
+    try:
+        async for position in ticket.wait():
+            yield f"Waiting for a free slot... (position {position} in the queue)"
+
+        if split_paragraphs:
+            stream = simplify_text_chunked_stream_async(
+                text, llm, use_rules, top_k, top_p, temp, slot=SlotGroup(ticket).slot
+            )
+        else:
+            stream = simplify_text_stream_async(text, llm, use_rules, top_k, top_p, temp)
+        simplified_text = ""
+        async for chunk in stream:
+            simplified_text += chunk
+            yield simplified_text
+    except QueueTimeoutError as e:
+        raise gr.Error(str(e))
+    finally:
+        ticket.release()
+
+
+def get_model_choices(wait: float = 0) -> tuple[list[str], str]:
+    """
+    Return the models of LLM_CHOICES available on the LLM servers and the default model.
+
+    As long as no server has listed its models (e.g. while they start), all of LLM_CHOICES
+    are offered.
+    """
+    available = available_models(wait)
+    choices = sorted(set(p.LLM_CHOICES) & set(available)) if available else p.LLM_CHOICES
+    if not available or p.MODEL in available:
+        return choices, p.MODEL
+    return choices, choices[0] if choices else None
+
+
+def warm_up_model(model: str):
+    """Load the selected model in the background, so it is ready when the user submits."""
+    warm_up([model])
+
+
+def update_model_choices():
+    choices, _ = get_model_choices()
+    return gr.update(choices=choices)
+
+
+admission = AdmissionController()
+
+# The models are discovered in the background, so a slow or unreachable LLM server does not
+# hold up the start. The choices of the dropdown are updated whenever the page is loaded
+discover_models()
+AVBL_LLM_CHOICES, DEFAULT_MODEL = get_model_choices(wait=p.MODELS_DISCOVERY_WAIT)
+
+model_dropdown = gr.Dropdown(
+    choices=AVBL_LLM_CHOICES, value=DEFAULT_MODEL, label="Model", allow_custom_value=True
+)
 
 ls_ui = gr.Interface(
-    simplify_text,
+    simplify,
     gr.Textbox(label="Original Text", lines=17, autoscroll=True),
     gr.Textbox(
         label="Leichte Sprache", lines=17, autoscroll=True, show_label=True, show_copy_button=True
     ),
     title="KI-Prototyp: Leichte Sprache für die Verwaltung",
     description="Simplify Text with LLMs! - <a href='https://github.com/aihpi/leichte-sprache' target='_blank'>Check the repository</a>",
-    examples=[[p.EXAMPLE, DEFAULT_MODEL, False, 5, 0.9, 0.3]],
+    examples=[[p.EXAMPLE, DEFAULT_MODEL, False, False, 5, 0.9, 0.3]],
     flagging_mode="manual",
     flagging_dir=p.EXPORT_PATH,
     flagging_options=[("Export", "export")],
     additional_inputs=[
-        gr.Dropdown(
-            choices=AVBL_LLM_CHOICES, value=DEFAULT_MODEL, label="Model", allow_custom_value=True
-        ),
+        model_dropdown,
         gr.Checkbox(value=p.USE_RULES, label="Use Rules", info="Use rules for simplification"),
+        gr.Checkbox(
+            value=p.SPLIT_PARAGRAPHS,
+            label="Split into paragraphs",
+            info="Simplify long texts paragraph by paragraph in parallel",
+        ),
         gr.Slider(1, 10, value=p.TOP_K, step=1, label="Top k", info=pinfo.get("Top k")),
         gr.Slider(
             0.1, 1, value=p.TOP_P, step=0.1, label="Top p", info=pinfo.get("Top p"), visible=False
@@ -39,9 +122,23 @@ ls_ui = gr.Interface(
     ],
     additional_inputs_accordion=gr.Accordion(label="Settings", open=False),
     submit_btn="Simplify!",
+    # Requests are handled in the event loop, not in worker threads, and queued per model by
+    # the admission controller, so they need no limit here
+    concurrency_limit=p.UI_CONCURRENCY_LIMIT,
     css="footer {visibility: hidden}",
 )
 
+with ls_ui:
+    model_dropdown.change(warm_up_model, model_dropdown, None, queue=False)
+    ls_ui.load(update_model_choices, None, model_dropdown, queue=False)
+
 if __name__ == "__main__":
 
+    if p.METRICS_PORT:
+        start_metrics_server(p.METRICS_PORT)
+    # Load the default model before the first user arrives, the others in the background
+    if p.WARMUP in ("default", "all"):
+        warm_up([DEFAULT_MODEL], background=False)
+    if p.WARMUP == "all":
+        warm_up([model for model in AVBL_LLM_CHOICES if model != DEFAULT_MODEL])
     ls_ui.launch()
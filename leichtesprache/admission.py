@@ -0,0 +1,214 @@
+import logging, os
+import asyncio, time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from leichtesprache.metrics import QUEUE_LENGTH, observe_queue_wait
+from leichtesprache.parameters import MAX_CONCURRENT_PER_MODEL, MAX_QUEUE, QUEUE_TIMEOUT
+
+logging.basicConfig(format=os.getenv("LOG_FORMAT", "%(asctime)s [%(levelname)s] %(message)s"))
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
+
+# ============== Admission Control ============================================
+
+
+class QueueFullError(Exception):
+    """The request was rejected because the wait queue of the model is full."""
+
+
+class QueueTimeoutError(Exception):
+    """The request waited longer than the queue timeout for a free slot."""
+
+
+class Ticket:
+    """A request waiting for or holding a generation slot of a model (see AdmissionController)."""
+
+    def __init__(self, controller: "AdmissionController", model: str):
+        self.controller = controller
+        self.model = model
+        self.created = time.perf_counter()
+        self.admitted = False
+        self.released = False
+
+    @property
+    def position(self) -> int:
+        """Position in the wait queue (1 = next), 0 once admitted."""
+        if self.admitted:
+            return 0
+        return self.controller._state(self.model)["waiting"].index(self) + 1
+
+    async def wait(self) -> AsyncIterator[int]:
+        """
+        Wait for a free slot, yielding the queue position whenever it changes.
+
+        Raises:
+            QueueTimeoutError: If no slot became free within the queue timeout.
+        """
+        state = self.controller._state(self.model)
+        deadline = self.created + self.controller.queue_timeout
+        last_position = None
+        while not self.admitted:
+            if self.position != last_position:
+                last_position = self.position
+                yield last_position
+                continue
+            remaining = deadline - time.perf_counter()
+            if self.controller.queue_timeout and remaining <= 0:
+                self.release()
+                raise QueueTimeoutError(
+                    f"No free slot for {self.model} within "
+                    f"{self.controller.queue_timeout:.0f}s. Please try again later."
+                )
+            async with state["changed"]:
+                if self.admitted:
+                    break
+                try:
+                    timeout = remaining if self.controller.queue_timeout else None
+                    await asyncio.wait_for(state["changed"].wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        observe_queue_wait(time.perf_counter() - self.created, self.model)
+
+    def release(self):
+        """Give the slot back, or leave the queue if not admitted yet. Safe to call twice."""
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+
+class SlotGroup:
+    """
+    Generation slots of a request that runs several generations at once (e.g. the chunks of a
+    long text), so each of them counts against the limit of the model.
+
+    The admitted ticket of the request is one slot of the group. Each further generation takes
+    an extra slot if one is free right away, and otherwise waits for the slot of the request.
+    Slots are only free while no request is waiting, so the extra slots never pass the queue,
+    and the request cannot wait for slots held by itself.
+
+    Usage:
+
+        group = SlotGroup(ticket)
+        async with group.slot():
+            ...  # Generate
+    """
+
+    def __init__(self, ticket: Ticket):
+        self.ticket = ticket
+        self._own = asyncio.Semaphore(1)
+
+    @asynccontextmanager
+    async def slot(self):
+        extra = self.ticket.controller.try_enter(self.ticket.model)
+        if extra is None:
+            async with self._own:
+                yield
+            return
+        try:
+            yield
+        finally:
+            extra.release()
+
+
+class AdmissionController:
+    """
+    Limits the number of concurrent generations per model, with a bounded wait queue.
+
+    Requests beyond `max_concurrent` wait in a first-in first-out queue of at most
+    `max_queue` requests per model. Requests that find the queue full are rejected right away
+    (QueueFullError), and requests waiting longer than `queue_timeout` seconds give up
+    (QueueTimeoutError). This keeps the load on the LLM server at what it can run in parallel,
+    so latency stays predictable under bursts. Meant for use from a single event loop.
+
+    Usage:
+
+        ticket = controller.enter(model)
+        try:
+            async for position in ticket.wait():
+                ...  # Show the position in the queue
+            ...  # Generate
+        finally:
+            ticket.release()
+
+    Args:
+        max_concurrent (int, optional): Generations per model at a time. 0 = unlimited.
+        max_queue (int, optional): Requests per model waiting for a slot. Defaults to MAX_QUEUE.
+        queue_timeout (float, optional): Seconds a request may wait for a slot. 0 = no limit.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_PER_MODEL,
+        max_queue: int = MAX_QUEUE,
+        queue_timeout: float = QUEUE_TIMEOUT,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._models = {}
+
+    def _state(self, model: str) -> dict:
+        if model not in self._models:
+            self._models[model] = {
+                "active": 0,
+                "waiting": deque(),
+                "changed": asyncio.Condition(),
+            }
+        return self._models[model]
+
+    def enter(self, model: str) -> Ticket:
+        """
+        Request a generation slot for the model.
+
+        Raises:
+            QueueFullError: If all slots are taken and the wait queue is full.
+        """
+        state = self._state(model)
+        ticket = Ticket(self, model)
+        if not self.max_concurrent or state["active"] < self.max_concurrent:
+            ticket.admitted = True
+            state["active"] += 1
+        elif len(state["waiting"]) < self.max_queue:
+            state["waiting"].append(ticket)
+            QUEUE_LENGTH.set(len(state["waiting"]), model=model)
+        else:
+            logger.warning(f"Rejected request for {model}: queue full")
+            raise QueueFullError(
+                f"Too many requests for {model} at the moment. Please try again later."
+            )
+        return ticket
+
+    def try_enter(self, model: str) -> Ticket | None:
+        """Return an admitted ticket if a slot of the model is free right away, else None."""
+        state = self._state(model)
+        if self.max_concurrent and state["active"] >= self.max_concurrent:
+            return None
+        ticket = Ticket(self, model)
+        ticket.admitted = True
+        state["active"] += 1
+        return ticket
+
+    def _release(self, ticket: Ticket):
+        state = self._state(ticket.model)
+        if ticket.admitted:
+            state["active"] -= 1
+        else:
+            state["waiting"].remove(ticket)
+        # Hand free slots to the requests waiting longest
+        while state["waiting"] and (
+            not self.max_concurrent or state["active"] < self.max_concurrent
+        ):
+            state["waiting"].popleft().admitted = True
+            state["active"] += 1
+        QUEUE_LENGTH.set(len(state["waiting"]), model=ticket.model)
+        asyncio.get_running_loop().create_task(self._notify(state["changed"]))
+
+    @staticmethod
+    async def _notify(condition: asyncio.Condition):
+        async with condition:
+            condition.notify_all()
+
+    def stats(self, model: str) -> dict:
+        state = self._state(model)
+        return {"active": state["active"], "waiting": len(state["waiting"])}
@@ -0,0 +1,578 @@
+import logging, os
+import argparse, json, platform, re, subprocess
+import threading, time, tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable, List
+import numpy as np
+import pandas as pd
+from leichtesprache.cache import configure_cache
+from leichtesprache.core import simplify_text
+from leichtesprache.llm import APIS, configure_client
+from leichtesprache.tools.process_dataset import process_df_w_llm
+from leichtesprache.tools.readability import score_texts
+from leichtesprache.utils import bounded_map, read_table
+import leichtesprache.parameters as p
+
+logging.basicConfig(format=os.getenv("LOG_FORMAT", "%(asctime)s [%(levelname)s] %(message)s"))
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
+
+# Benchmarks of the simplification pipeline against a local stub of the Ollama API, so they
+# run offline and measure the overhead of this package rather than the speed of a model.
+
+SYNTHETIC_RESPONSE = (
+    "In unserer Gemeinde gibt es Kinder·krippen und Kinder·gärten.\n"
+    "Dort werden Kinder betreut.\n"
+    "Die Gemeinde kümmert sich darum.\n"
+    "Die evangelische Kirche kümmert sich auch darum.\n"
+    "Sie können wählen, wie lange Ihr Kind dort bleibt."
+)
+
+# ============== Stub LLM Server ==============================================
+
+
+class StubOllamaServer:
+    """
+    Local stand-in for the Ollama API that replays responses with a simulated model speed.
+
+    Every /api/generate request waits `latency` seconds (time to first token) and then
+    returns the next response, one token (word) every 1/`tokens_per_sec` seconds. Streaming
+    and non-streaming requests are supported, as well as /api/tags and the keep_alive-only
+    requests used to load and unload models. The OpenAI-compatible API is served the same way
+    (/v1/completions, /v1/chat/completions and /v1/models).
+
+    Args:
+        responses (List[str], optional): Responses replayed in turn. Defaults to a synthetic one.
+        latency (float, optional): Seconds until the first token. Defaults to 0.1.
+        tokens_per_sec (float, optional): Generation speed. 0 returns the whole text at once.
+        models (List[str], optional): Models listed by /api/tags. Defaults to LLM_CHOICES.
+        port (int, optional): Port to listen on. Defaults to 0 (a free port).
+    """
+
+    def __init__(
+        self,
+        responses: List[str] | None = None,
+        latency: float = 0.1,
+        tokens_per_sec: float = 50.0,
+        models: List[str] | None = None,
+        port: int = 0,
+    ):
+        self.responses = responses or [SYNTHETIC_RESPONSE]
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.models = models or p.LLM_CHOICES
+        self.requests = 0
+        self._lock = threading.Lock()
+        handler = type("StubHandler", (StubHandler,), {"stub": self})
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def next_response(self) -> str:
+        with self._lock:
+            response = self.responses[self.requests % len(self.responses)]
+            self.requests += 1
+        return response
+
+    def start(self) -> "StubOllamaServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes: without this, Nagle's algorithm and delayed ACKs
+    # add ~40 ms to every keep-alive request
+    disable_nagle_algorithm = True
+    stub: StubOllamaServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, obj: dict):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunk(self, obj: dict | str, event_stream: bool = False):
+        if event_stream:
+            line = f"data: {obj if isinstance(obj, str) else json.dumps(obj)}\n\n"
+        else:
+            line = json.dumps(obj) + "\n"
+        line = line.encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def start_stream(self, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        if path == "/api/tags":
+            models = [
+                {"name": name, "digest": f"stub-{i}"} for i, name in enumerate(self.stub.models)
+            ]
+            self.send_json({"models": models})
+        elif path == "/v1/models":
+            models = [{"id": name, "object": "model"} for name in self.stub.models]
+            self.send_json({"object": "list", "data": models})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        length = int(self.headers.get("Content-Length", 0))
+        data = json.loads(self.rfile.read(length) or b"{}")
+        if path == "/api/generate":
+            self.generate(data)
+        elif path in ("/v1/completions", "/v1/chat/completions"):
+            self.completions(data, chat=path.endswith("chat/completions"))
+        else:
+            self.send_error(404)
+
+    def tokens(self) -> tuple[List[str], float]:
+        """Return the tokens of the next response and the delay between them."""
+        tokens = re.findall(r"\S+\s*", self.stub.next_response())
+        delay = 1 / self.stub.tokens_per_sec if self.stub.tokens_per_sec > 0 else 0
+        time.sleep(self.stub.latency)
+        return tokens, delay
+
+    def generate(self, data: dict):
+        if not data.get("prompt"):
+            # Requests without a prompt only load or unload the model
+            self.send_json({"model": data.get("model"), "response": "", "done": True})
+            return
+
+        start = time.perf_counter()
+        tokens, delay = self.tokens()
+
+        def stats() -> dict:
+            total = int((time.perf_counter() - start) * 1e9)
+            return {
+                "model": data.get("model"),
+                "done": True,
+                "done_reason": "stop",
+                "total_duration": total,
+                "load_duration": 0,
+                "prompt_eval_count": len(data["prompt"].split()),
+                "prompt_eval_duration": int(self.stub.latency * 1e9),
+                "eval_count": len(tokens),
+                "eval_duration": total - int(self.stub.latency * 1e9),
+            }
+
+        if data.get("stream", True):
+            self.start_stream("application/x-ndjson")
+            for token in tokens:
+                self.send_chunk({"model": data.get("model"), "response": token, "done": False})
+                time.sleep(delay)
+            self.send_chunk({**stats(), "response": ""})
+            self.end_stream()
+        else:
+            time.sleep(delay * len(tokens))
+            self.send_json({**stats(), "response": "".join(tokens)})
+
+    def completions(self, data: dict, chat: bool = False):
+        if chat:
+            prompts = [" ".join(message["content"] for message in data.get("messages", []))]
+        else:
+            prompts = data.get("prompt", "")
+            prompts = [prompts] if isinstance(prompts, str) else prompts
+        tokens, delay = self.tokens()
+        # The prompts of a batch are generated side by side, as on a server with batching
+        outputs = [tokens] + [
+            re.findall(r"\S+\s*", self.stub.next_response()) for _ in prompts[1:]
+        ]
+        prompt_tokens = sum(len(prompt.split()) for prompt in prompts)
+        completion_tokens = sum(len(output) for output in outputs)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+        def choice(
+            text: str, finish_reason: str | None = None, delta: bool = False, index: int = 0
+        ) -> dict:
+            if chat:
+                key = "delta" if delta else "message"
+                return {"index": index, key: {"content": text}, "finish_reason": finish_reason}
+            return {"index": index, "text": text, "finish_reason": finish_reason}
+
+        if data.get("stream"):
+            self.start_stream("text/event-stream")
+            for token in tokens:
+                self.send_chunk({"choices": [choice(token, delta=True)]}, event_stream=True)
+                time.sleep(delay)
+            self.send_chunk({"choices": [choice("", "stop", delta=True)]}, event_stream=True)
+            if (data.get("stream_options") or {}).get("include_usage"):
+                self.send_chunk({"choices": [], "usage": usage}, event_stream=True)
+            self.send_chunk("[DONE]", event_stream=True)
+            self.end_stream()
+        else:
+            time.sleep(delay * max(len(output) for output in outputs))
+            choices = [
+                choice("".join(output), "stop", index=i) for i, output in enumerate(outputs)
+            ]
+            self.send_json({"model": data.get("model"), "choices": choices, "usage": usage})
+
+
+def load_responses(file_path: str, column: str = "Leichte Sprache") -> List[str]:
+    """
+    Load recorded responses to replay, from a JSONL file with a "response" field per line
+    (e.g. a process_dataset checkpoint) or from a column of a dataset.
+    """
+    if file_path.endswith(".jsonl"):
+        with open(file_path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        responses = [record.get("response") for record in records]
+    else:
+        responses = read_table(file_path, columns=[column])[column].to_list()
+    return [response for response in responses if isinstance(response, str) and response]
+
+
+# ============== Measurements =================================================
+
+
+def latency_stats(latencies: Iterable[float], elapsed: float, errors: int = 0) -> dict:
+    """Summarize request latencies (in seconds) as percentiles in ms and requests per second."""
+    latencies = np.asarray(list(latencies), dtype=float)
+    if latencies.size == 0:
+        return {"requests": 0, "errors": errors}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        "requests": int(latencies.size),
+        "errors": errors,
+        "p50_ms": round(p50, 2),
+        "p95_ms": round(p95, 2),
+        "p99_ms": round(p99, 2),
+        "mean_ms": round(latencies.mean() * 1000, 2),
+        "max_ms": round(latencies.max() * 1000, 2),
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_sec": round(latencies.size / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+def max_rss_mb() -> float | None:
+    """Peak resident memory of this process in MB, or None where it is not available."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def measure_memory(func: Callable, trace_memory: bool = False):
+    """
+    Call func and return its result with the memory used.
+
+    Python allocations are traced with tracemalloc if `trace_memory` is set. It slows the
+    code down noticeably, so the timings of such a run should not be compared to others.
+    """
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        result = func()
+        memory = {"max_rss_mb": max_rss_mb()}
+        if trace_memory:
+            memory["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return result, memory
+
+
+def run_concurrent(func: Callable, items: list, concurrency: int) -> dict:
+    """Call func on every item with `concurrency` threads and collect the latency statistics."""
+
+    def timed(item):
+        start = time.perf_counter()
+        result = func(item)
+        if result is None:
+            raise RuntimeError("No response")
+        return time.perf_counter() - start
+
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for _, result in bounded_map(timed, items, workers=concurrency):
+        if isinstance(result, Exception):
+            errors += 1
+        else:
+            latencies.append(result)
+    return latency_stats(latencies, time.perf_counter() - start, errors)
+
+
+# ============== Benchmarks ===================================================
+
+
+def bench_simplify_text(texts: List[str], concurrency: int, use_rules: bool = False) -> dict:
+    """Latency and throughput of simplify_text with `concurrency` requests in flight."""
+
+    def simplify(text: str) -> str:
+        return simplify_text(text, p.MODEL, use_rules, p.TOP_K, p.TOP_P, p.TEMP)
+
+    return run_concurrent(simplify, texts, concurrency)
+
+
+def bench_process_df(texts: List[str], concurrency: int, workers: int = 1) -> dict:
+    """Throughput of process_df_w_llm on a dataset of the given texts (generation and scoring)."""
+    df = pd.DataFrame({"Original": texts})
+    start = time.perf_counter()
+    df = process_df_w_llm(
+        df, p.MODEL, verbose=False, concurrency=concurrency, retries=1, workers=workers
+    )
+    elapsed = time.perf_counter() - start
+    return {
+        "rows": df.shape[0],
+        "errors": int(df[f"{p.MODEL} FRE Score"].isna().sum()),
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_sec": round(df.shape[0] / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+def bench_scoring(texts: List[str], workers: int = 1, repeat: int = 5) -> dict:
+    """Latency of score_texts on the whole list of texts, repeated `repeat` times."""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        score_texts(texts, workers=workers)
+        latencies.append(time.perf_counter() - start)
+    stats = latency_stats(latencies, sum(latencies))
+    stats["texts_per_sec"] = round(len(texts) * repeat / sum(latencies), 1)
+    return stats
+
+
+def run_benchmarks(
+    stub: StubOllamaServer,
+    concurrency_levels: List[int],
+    requests: int = 100,
+    rows: int = 100,
+    texts: int = 1000,
+    workers_levels: List[int] = (1,),
+    trace_memory: bool = False,
+    api: str = "ollama",
+) -> List[dict]:
+    """Run all benchmarks against a started stub server and return one result per case."""
+    configure_client([stub.base_url], api=api, pool_size=max(concurrency_levels))
+    # Every request should reach the stub server
+    configure_cache(None)
+
+    inputs = [f"{p.EXAMPLE} ({i})" for i in range(max(requests, rows))]
+    results = []
+
+    def record(benchmark: str, func: Callable, **params):
+        logger.info(f"Running {benchmark} {params}")
+        stats, memory = measure_memory(func, trace_memory)
+        results.append({"benchmark": benchmark, **params, **stats, **memory})
+
+    for concurrency in concurrency_levels:
+        record(
+            "simplify_text",
+            lambda: bench_simplify_text(inputs[:requests], concurrency),
+            concurrency=concurrency,
+        )
+    for concurrency in concurrency_levels:
+        record(
+            "process_df_w_llm",
+            lambda: bench_process_df(inputs[:rows], concurrency),
+            concurrency=concurrency,
+        )
+
+    samples = [p.EXAMPLE, *stub.responses]
+    score_inputs = [samples[i % len(samples)] for i in range(texts)]
+    for workers in workers_levels:
+        record("score_texts", lambda: bench_scoring(score_inputs, workers), workers=workers)
+    return results
+
+
+def get_version() -> str:
+    """Return the git commit of the code under test, if available."""
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(__file__),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+def compare_results(baseline: dict, current: dict) -> pd.DataFrame:
+    """
+    Compare two benchmark reports case by case.
+
+    Returns:
+        pd.DataFrame: The p50/p95 latency and throughput of both runs and the change in %.
+    """
+    keys = ["benchmark", "concurrency", "workers"]
+    metrics = ["p50_ms", "p95_ms", "requests_per_sec", "rows_per_sec", "texts_per_sec"]
+    old = pd.DataFrame(baseline["results"])
+    new = pd.DataFrame(current["results"])
+    keys = [key for key in keys if key in old.columns and key in new.columns]
+    merged = old.merge(new, on=keys, suffixes=(" old", " new"))
+
+    columns = {}
+    for metric in metrics:
+        if f"{metric} old" not in merged.columns:
+            continue
+        columns[f"{metric} old"] = merged[f"{metric} old"]
+        columns[f"{metric} new"] = merged[f"{metric} new"]
+        change = (merged[f"{metric} new"] / merged[f"{metric} old"] - 1) * 100
+        columns[f"{metric} change %"] = change.round(1)
+    comparison = pd.DataFrame(columns)
+    comparison.index = [
+        " ".join(
+            [row["benchmark"]]
+            + [f"{key}={int(row[key])}" for key in keys[1:] if pd.notna(row[key])]
+        )
+        for _, row in merged.iterrows()
+    ]
+    return comparison.dropna(axis=1, how="all")
+
+
+def main(
+    output_file: str | None = None,
+    baseline_file: str | None = None,
+    responses_file: str | None = None,
+    latency: float = 0.1,
+    tokens_per_sec: float = 50.0,
+    **kwargs,
+) -> dict:
+    """
+    Run the benchmark suite against a stub server and print and save the results.
+
+    Keyword arguments are passed on to run_benchmarks.
+    """
+    responses = load_responses(responses_file) if responses_file else None
+    with StubOllamaServer(responses, latency=latency, tokens_per_sec=tokens_per_sec) as stub:
+        results = run_benchmarks(stub, **kwargs)
+
+    report = {
+        "version": get_version(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "stub": {
+            "latency": latency,
+            "tokens_per_sec": tokens_per_sec,
+            "api": kwargs.get("api", "ollama"),
+        },
+        "results": results,
+    }
+
+    print(pd.DataFrame(results).set_index("benchmark").to_markdown())
+    if output_file:
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Saved results to {output_file}")
+    if baseline_file:
+        with open(baseline_file, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nCompared to {baseline_file} ({baseline.get('version') or 'unknown version'}):")
+        print(compare_results(baseline, report).to_markdown())
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the simplification pipeline against a local stub LLM server."
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=[1, 4, 16],
+        help="Numbers of concurrent requests to benchmark.",
+    )
+    parser.add_argument(
+        "-n", "--requests", type=int, default=100, help="Requests per simplify_text run."
+    )
+    parser.add_argument("--rows", type=int, default=100, help="Rows per process_df_w_llm run.")
+    parser.add_argument("--texts", type=int, default=1000, help="Texts per score_texts run.")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1],
+        help="Numbers of scoring processes to benchmark.",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.1, help="Seconds until the stub sends the first token."
+    )
+    parser.add_argument(
+        "--tokens-per-sec",
+        type=float,
+        default=50.0,
+        help="Generation speed of the stub (0 = instant).",
+    )
+    parser.add_argument(
+        "--responses",
+        type=str,
+        default=None,
+        help="JSONL file (e.g. a checkpoint) or dataset with recorded responses to replay.",
+    )
+    parser.add_argument(
+        "--api",
+        choices=list(APIS),
+        default="ollama",
+        help="API the stub is called with (Ollama or OpenAI-compatible).",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Trace the peak of Python allocations (slows the benchmarks down).",
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, default=None, help="Save the results to this JSON file."
+    )
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default=None,
+        help="JSON results of an earlier run to compare with.",
+    )
+
+    args = parser.parse_args()
+
+    main(
+        args.output,
+        args.baseline,
+        args.responses,
+        latency=args.latency,
+        tokens_per_sec=args.tokens_per_sec,
+        concurrency_levels=args.concurrency,
+        requests=args.requests,
+        rows=args.rows,
+        texts=args.texts,
+        workers_levels=args.workers,
+        trace_memory=args.trace_memory,
+        api=args.api,
+    )
@@ -0,0 +1,184 @@
+import logging, os
+import hashlib, json
+import sqlite3, threading, time
+from leichtesprache.parameters import CACHE_PATH, CACHE_MAX_ENTRIES, CACHE_MAX_AGE_DAYS
+
+logging.basicConfig(format=os.getenv("LOG_FORMAT", "%(asctime)s [%(levelname)s] %(message)s"))
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
+
+# ============== Response Cache ===============================================
+
+
+class ResponseCache:
+    """
+    Persistent cache for LLM responses, stored in a SQLite database.
+
+    Entries are addressed by a hash of everything that determines the generation (see make_key).
+    The database runs in WAL mode, so the cache can be shared by several processes, e.g. the
+    Gradio app and a batch run of process_dataset. Each thread uses its own connection.
+
+    Args:
+        path (str): Path to the SQLite database file. It is created if it does not exist.
+        max_entries (int, optional): Maximum number of entries. The least recently used entries are evicted first.
+        max_age_days (float, optional): Entries older than this are evicted. 0 disables age-based eviction.
+    """
+
+    EVICT_EVERY = 100  # Number of insertions between eviction runs
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_age_days: float = CACHE_MAX_AGE_DAYS,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self._insertions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses (accessed)")
+        self.evict()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(
+        prompt: str,
+        model: str,
+        digest: str,
+        top_k: int,
+        top_p: float,
+        temp: float,
+        system: str | None = None,
+    ) -> str:
+        """Return the cache key for a generation request."""
+        settings = [prompt, model, digest, top_k, top_p, temp]
+        if system:
+            # Only added when set, so the keys of requests without system message stay the same
+            settings.append(system)
+        content = json.dumps(settings, ensure_ascii=False)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Return the cached response for the key, or None if there is none."""
+        with self._connection() as conn:
+            row = conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return row[0] if row is not None else None
+
+    def set(self, key: str, response: str):
+        """Store a response in the cache."""
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+        with self._lock:
+            self._insertions += 1
+            evict = self._insertions % self.EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Remove expired entries and the least recently used ones above max_entries."""
+        with self._connection() as conn:
+            if self.max_age > 0:
+                conn.execute(
+                    "DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,)
+                )
+            if self.max_entries > 0:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+    def clear(self):
+        """Remove all entries."""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        """Return the hit/miss counters of this process and the size of the cache."""
+        with self._connection() as conn:
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(response)), 0) FROM responses"
+            ).fetchone()
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / requests, 3) if requests else 0.0,
+            "entries": entries,
+            "size_chars": size,
+        }
+
+
+_cache = None
+_cache_configured = False
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache | None:
+    """Return the shared response cache, or None if caching is disabled (no CACHE_PATH)."""
+    global _cache, _cache_configured
+    if not _cache_configured:
+        with _cache_lock:
+            if not _cache_configured:
+                _cache = ResponseCache(CACHE_PATH) if CACHE_PATH else None
+                _cache_configured = True
+    return _cache
+
+
+def configure_cache(path: str | None, **kwargs) -> ResponseCache | None:
+    """Replace the shared response cache. A path of None disables caching."""
+    global _cache, _cache_configured
+    with _cache_lock:
+        _cache = ResponseCache(path, **kwargs) if path else None
+        _cache_configured = True
+    return _cache
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or clear the LLM response cache.")
+    parser.add_argument("--path", type=str, default=CACHE_PATH, help="Path to the cache file.")
+    parser.add_argument("--clear", action="store_true", help="Remove all entries.")
+    args = parser.parse_args()
+
+    if not args.path:
+        parser.error("No cache path given and LS_CACHE_PATH is not set.")
+    cache = ResponseCache(args.path)
+    if args.clear:
+        cache.clear()
+        print(f"Cleared cache {args.path}")
+    print(cache.stats())
@@ -0,0 +1,94 @@
+import re
+from typing import List
+
+# ============== Text Chunking ================================================
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+HEADING_MAX_CHARS = 80
+
+
+def is_heading(line: str) -> bool:
+    """A heading is a markdown heading or a short line without final punctuation."""
+    line = line.strip()
+    if line.startswith("#"):
+        return True
+    return 0 < len(line) <= HEADING_MAX_CHARS and line[-1] not in ".!?:;,"
+
+
+def split_blocks(text: str) -> List[str]:
+    """
+    Split a text into blocks at empty lines and headings.
+
+    A heading starts a new block and stays together with the text that follows it.
+    """
+    blocks, current = [], []
+    for line in text.splitlines():
+        if not line.strip():
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            continue
+        if is_heading(line) and current and not is_heading(current[-1]):
+            blocks.append("\n".join(current))
+            current = []
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def split_long_block(block: str, max_chars: int) -> List[str]:
+    """Split a block longer than max_chars at sentence boundaries."""
+    parts, current = [], ""
+    for sentence in SENTENCE_END.split(block):
+        if current and len(current) + len(sentence) + 1 > max_chars:
+            parts.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_text(text: str, max_chars: int = 1500) -> List[str]:
+    """
+    Split a text into chunks of paragraphs of at most max_chars characters.
+
+    Paragraphs (and headings with their paragraph) are kept whole and consecutive small ones
+    are merged. Only a single paragraph longer than max_chars is split, at sentence boundaries.
+
+    Args:
+        text (str): The text to split.
+        max_chars (int, optional): Target maximum length of a chunk. Defaults to 1500.
+
+    Returns:
+        List[str]: The chunks in their original order.
+    """
+    chunks, current = [], ""
+    for block in split_blocks(text):
+        for part in split_long_block(block, max_chars) if len(block) > max_chars else [block]:
+            if current and len(current) + len(part) + 2 > max_chars:
+                chunks.append(current)
+                current = part
+            else:
+                current = f"{current}\n\n{part}" if current else part
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def chunk_context(chunks: List[str], overlap: int = 200) -> List[str]:
+    """
+    Return for each chunk the end of the preceding chunk, at most `overlap` characters long.
+
+    The context is cut at a sentence boundary where possible and is empty for the first chunk.
+    """
+    contexts = [""]
+    for previous in chunks[:-1]:
+        context = previous[-overlap:] if overlap > 0 else ""
+        if len(previous) > overlap > 0:
+            sentences = SENTENCE_END.split(context, maxsplit=1)
+            context = sentences[-1] if len(sentences) > 1 else context
+        contexts.append(context.strip())
+    return contexts
@@ -0,0 +1,276 @@
+import logging, os
+import asyncio, threading
+from typing import AsyncIterator, Awaitable, Callable, Iterator
+from leichtesprache.parameters import COALESCE
+
+logging.basicConfig(format=os.getenv("LOG_FORMAT", "%(asctime)s [%(levelname)s] %(message)s"))
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
+
+# ============== Request Coalescing ===========================================
+
+
+class Flight:
+    """
+    A generation shared by identical requests in flight.
+
+    The generated chunks are added as they arrive, and every request sharing the generation
+    follows them, from a thread (follow) or from an event loop (follow_async). A generation
+    that is not streamed is added as a single chunk.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.chunks = []
+        self.done = False
+        self.ok = False
+        self.subscribers = 1
+        self.task = None
+        self._changed = threading.Condition()
+        self._waiters = []
+
+    @property
+    def result(self) -> str | None:
+        """The generated text, None if the generation failed."""
+        return "".join(self.chunks) if self.ok else None
+
+    def add(self, chunk: str):
+        with self._changed:
+            self.chunks.append(chunk)
+            self._notify()
+
+    def finish(self, ok: bool):
+        with self._changed:
+            self.done = True
+            self.ok = ok
+            self._notify()
+
+    def _notify(self):
+        self._changed.notify_all()
+        for future in self._waiters:
+            future.get_loop().call_soon_threadsafe(_resolve, future)
+        self._waiters = []
+
+    def follow(self) -> Iterator[str]:
+        """Yield the chunks generated so far and then the new ones, until the generation ends."""
+        position = 0
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self.done or len(self.chunks) > position)
+                chunks, done = self.chunks[position:], self.done
+            position += len(chunks)
+            yield from chunks
+            if done:
+                return
+
+    async def follow_async(self) -> AsyncIterator[str]:
+        """Asynchronous version of follow."""
+        position = 0
+        while True:
+            with self._changed:
+                chunks, done = self.chunks[position:], self.done
+                if not chunks and not done:
+                    future = asyncio.get_running_loop().create_future()
+                    self._waiters.append(future)
+            if not chunks and not done:
+                await future
+                continue
+            position += len(chunks)
+            for chunk in chunks:
+                yield chunk
+            if done:
+                return
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class SingleFlight:
+    """
+    Lets identical requests in flight share one generation ("single flight").
+
+    The first request for a key starts the generation, and requests with the same key arriving
+    before it is done wait for it and get the same result (or follow the same stream) instead
+    of generating again. Unlike the response cache, this covers the time before any result
+    exists, e.g. a burst of users submitting the same text. Once the generation is done, the
+    key is free again.
+
+    Synchronous generations run in the thread of the first request. If that request stops
+    reading a stream, the generation still runs to the end for the others. Asynchronous
+    generations run in a task that is cancelled when no request is waiting for it anymore.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: str) -> tuple[Flight, bool]:
+        """Return the flight of the key and whether it is new (the caller has to generate)."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.subscribers += 1
+                return flight, False
+            flight = self._flights[key] = Flight(key)
+            return flight, True
+
+    def leave(self, flight: Flight):
+        """Stop waiting for the flight. The last one to leave cancels an unfinished task."""
+        with self._lock:
+            flight.subscribers -= 1
+            if flight.subscribers or flight.done:
+                return
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        if flight.task is not None:
+            flight.task.get_loop().call_soon_threadsafe(flight.task.cancel)
+
+    def complete(self, flight: Flight, ok: bool):
+        """End the generation of the flight and free its key."""
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        flight.finish(ok)
+
+    # ---- Synchronous ----
+
+    def run(self, key: str, generate: Callable[[], str | None]) -> tuple[str | None, bool]:
+        """
+        Call `generate` unless an identical request is in flight, then wait for its result.
+
+        Returns:
+            tuple[str | None, bool]: The result and whether it was shared from another request.
+        """
+        flight, leader = self.join(key)
+        try:
+            if not leader:
+                chunks = list(flight.follow())
+                return ("".join(chunks) if flight.ok else None), True
+            result = None
+            try:
+                result = generate()
+            finally:
+                if result is not None:
+                    flight.add(result)
+                self.complete(flight, result is not None)
+            return result, False
+        finally:
+            self.leave(flight)
+
+    def stream(
+        self,
+        key: str,
+        generate: Callable[[], Iterator[str]],
+        complete: Callable[[], bool] = lambda: True,
+    ) -> tuple[Iterator[str], Flight | None]:
+        """
+        Stream the chunks of `generate` unless an identical request is in flight, then follow
+        its chunks. `complete` tells whether a stream that ended was generated completely.
+
+        Returns:
+            tuple[Iterator[str], Flight | None]: The chunks, and the flight of the other request
+            if they are shared (its `ok` tells whether the stream was complete), else None.
+        """
+        flight, leader = self.join(key)
+        if leader:
+            return self._lead(flight, generate(), complete), None
+        return self._follow(flight), flight
+
+    def _lead(self, flight: Flight, chunks: Iterator[str], complete: Callable[[], bool]):
+        ok = False
+        try:
+            for chunk in chunks:
+                flight.add(chunk)
+                yield chunk
+            ok = complete()
+        except GeneratorExit:
+            # The consumer stopped reading: finish the generation for the requests sharing it
+            if flight.subscribers > 1:
+                for chunk in chunks:
+                    flight.add(chunk)
+                ok = complete()
+            raise
+        finally:
+            self.complete(flight, ok)
+            self.leave(flight)
+
+    def _follow(self, flight: Flight) -> Iterator[str]:
+        try:
+            yield from flight.follow()
+        finally:
+            self.leave(flight)
+
+    # ---- Asynchronous ----
+
+    async def run_async(
+        self, key: str, generate: Callable[[], Awaitable[str | None]]
+    ) -> tuple[str | None, bool]:
+        """Asynchronous version of run. The generation runs in a task."""
+        flight, leader = self.join(key)
+        if leader:
+            flight.task = asyncio.create_task(self._produce(flight, generate))
+        try:
+            chunks = [chunk async for chunk in flight.follow_async()]
+            return ("".join(chunks) if flight.ok else None), not leader
+        finally:
+            self.leave(flight)
+
+    def stream_async(
+        self,
+        key: str,
+        generate: Callable[[], AsyncIterator[str]],
+        complete: Callable[[], bool] = lambda: True,
+    ) -> tuple[AsyncIterator[str], Flight | None]:
+        """Asynchronous version of stream. The generation runs in a task."""
+        flight, leader = self.join(key)
+        if not leader:
+            return self._follow_async(flight), flight
+        flight.task = asyncio.create_task(self._produce_stream(flight, generate, complete))
+        return self._follow_async(flight), None
+
+    async def _produce(self, flight: Flight, generate: Callable[[], Awaitable[str | None]]):
+        result = None
+        try:
+            result = await generate()
+        finally:
+            if result is not None:
+                flight.add(result)
+            self.complete(flight, result is not None)
+
+    async def _produce_stream(
+        self,
+        flight: Flight,
+        generate: Callable[[], AsyncIterator[str]],
+        complete: Callable[[], bool],
+    ):
+        ok = False
+        try:
+            async for chunk in generate():
+                flight.add(chunk)
+            ok = complete()
+        finally:
+            self.complete(flight, ok)
+
+    async def _follow_async(self, flight: Flight) -> AsyncIterator[str]:
+        try:
+            async for chunk in flight.follow_async():
+                yield chunk
+        finally:
+            self.leave(flight)
+
+
+_flights = SingleFlight() if COALESCE else None
+
+
+def get_flights() -> SingleFlight | None:
+    """Return the shared SingleFlight of the process, None if coalescing is disabled."""
+    return _flights
+
+
+def configure_flights(enabled: bool) -> SingleFlight | None:
+    """Enable or disable the coalescing of identical requests in flight."""
+    global _flights
+    _flights = SingleFlight() if enabled else None
+    return _flights
@@ -1,27 +1,518 @@
 import os, logging
-from leichtesprache.prompts import PROMPT_TEMPLATE, RULES_LS
-from leichtesprache.parameters import MODEL
-from leichtesprache.llm import llm_generate
+import asyncio, time
+from contextlib import nullcontext
+from typing import AsyncContextManager, AsyncIterator, Callable, Iterable, Iterator
+from leichtesprache.prompts import (
+    PROMPT_TEMPLATE,
+    PROMPT_TEMPLATE_PREFIX,
+    PROMPT_TEMPLATE_SYSTEM,
+    PROMPT_CONTEXT,
+    SYSTEM_PROMPT_LS,
+    RULES_LS,
+)
+from leichtesprache.parameters import (
+    MODEL,
+    NUM_PARALLEL,
+    PROMPTS_PER_REQUEST,
+    PROMPT_LAYOUT,
+    CHUNK_MAX_CHARS,
+    CHUNK_OVERLAP,
+)
+from leichtesprache.chunking import split_text, chunk_context
+from leichtesprache.utils import batched, bounded_map
+from leichtesprache.cache import ResponseCache, get_cache
+from leichtesprache.coalesce import get_flights
+from leichtesprache.metrics import RequestSpan, observe_queue_wait
+from leichtesprache.llm import (
+    llm_generate,
+    llm_generate_stream,
+    llm_generate_async,
+    llm_generate_stream_async,
+    llm_generate_batch,
+    supports_batch,
+    get_model_digest,
+    get_model_digest_async,
+)
 
 logging.basicConfig(format=os.getenv("LOG_FORMAT", "%(asctime)s [%(levelname)s] %(message)s"))
 logger = logging.getLogger(__name__)
 logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
 
+PROMPT_LAYOUTS = ["text-first", "prefix", "system"]
+
 
 def simplify_text(
-    text: str, llm: str, use_rules: bool, top_k: int, top_p: float, temp: float
+    text: str,
+    llm: str,
+    use_rules: bool,
+    top_k: int,
+    top_p: float,
+    temp: float,
+    context: str | None = None,
+) -> str:
+    with RequestSpan(llm or MODEL, "generate") as span:
+        with span.stage("prompt"):
+            llm, prompt, system = prepare_request(text, llm, use_rules, context)
+
+        cache, key = get_cache(), None
+        if cache:
+            with span.stage("cache"):
+                digest = get_model_digest(llm)
+                key = ResponseCache.make_key(prompt, llm, digest, top_k, top_p, temp, system)
+                cached_text = cache.get(key)
+            span.cache_result(cached_text is not None)
+            if cached_text is not None:
+                span.finish("ok")
+                return cached_text
+
+        info = {}
+
+        def generate() -> str | None:
+            return llm_generate(prompt, llm, top_k, top_p, temp, info, system)
+
+        flights = get_flights()
+        with span.stage("request"):
+            if flights:
+                flight_key = key or make_flight_key(prompt, llm, top_k, top_p, temp, system)
+                simplified_text, shared = flights.run(flight_key, generate)
+            else:
+                simplified_text, shared = generate(), False
+        if shared:
+            span.coalesce()
+        span.finish("ok" if simplified_text else "error", info)
+
+        if cache and simplified_text and not shared:
+            cache.set(key, simplified_text)
+        return simplified_text
+
+
+def simplify_text_stream(
+    text: str,
+    llm: str,
+    use_rules: bool,
+    top_k: int,
+    top_p: float,
+    temp: float,
+    context: str | None = None,
+) -> Iterator[str]:
+    """Same as simplify_text, but yields the simplified text in chunks as it is generated."""
+    with RequestSpan(llm or MODEL, "stream") as span:
+        with span.stage("prompt"):
+            llm, prompt, system = prepare_request(text, llm, use_rules, context)
+
+        cache, key = get_cache(), None
+        if cache:
+            with span.stage("cache"):
+                digest = get_model_digest(llm)
+                key = ResponseCache.make_key(prompt, llm, digest, top_k, top_p, temp, system)
+                cached_text = cache.get(key)
+            span.cache_result(cached_text is not None)
+            if cached_text is not None:
+                span.finish("ok")
+                yield cached_text
+                return
+
+        chunks, info, status = [], {}, "error"
+
+        def generate() -> Iterator[str]:
+            return llm_generate_stream(prompt, llm, top_k, top_p, temp, info, system)
+
+        flights, shared = get_flights(), None
+        start = time.perf_counter()
+        if flights:
+            flight_key = key or make_flight_key(prompt, llm, top_k, top_p, temp, system)
+            stream, shared = flights.stream(flight_key, generate, lambda: bool(info.get("done")))
+        else:
+            stream = generate()
+        if shared:
+            span.coalesce()
+        try:
+            for chunk in stream:
+                if not chunks:
+                    span.add("first_token", time.perf_counter() - start)
+                chunks.append(chunk)
+                yield chunk
+            done = shared.ok if shared else info.get("done")
+            status = "ok" if done else "error"
+        except GeneratorExit:
+            # The consumer stopped reading the stream
+            status = "cancelled"
+            raise
+        finally:
+            stream.close()
+            span.add("request", time.perf_counter() - start)
+            span.finish(status, info)
+
+        # Only complete generations are cached
+        if cache and info.get("done") and chunks:
+            cache.set(key, "".join(chunks))
+
+
+async def simplify_text_async(
+    text: str,
+    llm: str,
+    use_rules: bool,
+    top_k: int,
+    top_p: float,
+    temp: float,
+    context: str | None = None,
+) -> str:
+    """Asynchronous version of simplify_text."""
+    with RequestSpan(llm or MODEL, "generate") as span:
+        with span.stage("prompt"):
+            llm, prompt, system = prepare_request(text, llm, use_rules, context)
+
+        cache, key = get_cache(), None
+        if cache:
+            with span.stage("cache"):
+                digest = await get_model_digest_async(llm)
+                key = ResponseCache.make_key(prompt, llm, digest, top_k, top_p, temp, system)
+                cached_text = await asyncio.to_thread(cache.get, key)
+            span.cache_result(cached_text is not None)
+            if cached_text is not None:
+                span.finish("ok")
+                return cached_text
+
+        info = {}
+
+        async def generate() -> str | None:
+            return await llm_generate_async(prompt, llm, top_k, top_p, temp, info, system)
+
+        flights = get_flights()
+        with span.stage("request"):
+            if flights:
+                flight_key = key or make_flight_key(prompt, llm, top_k, top_p, temp, system)
+                simplified_text, shared = await flights.run_async(flight_key, generate)
+            else:
+                simplified_text, shared = await generate(), False
+        if shared:
+            span.coalesce()
+        span.finish("ok" if simplified_text else "error", info)
+
+        if cache and simplified_text and not shared:
+            await asyncio.to_thread(cache.set, key, simplified_text)
+        return simplified_text
+
+
+async def simplify_text_stream_async(
+    text: str,
+    llm: str,
+    use_rules: bool,
+    top_k: int,
+    top_p: float,
+    temp: float,
+    context: str | None = None,
+) -> AsyncIterator[str]:
+    """Asynchronous version of simplify_text_stream."""
+    with RequestSpan(llm or MODEL, "stream") as span:
+        with span.stage("prompt"):
+            llm, prompt, system = prepare_request(text, llm, use_rules, context)
+
+        cache, key = get_cache(), None
+        if cache:
+            with span.stage("cache"):
+                digest = await get_model_digest_async(llm)
+                key = ResponseCache.make_key(prompt, llm, digest, top_k, top_p, temp, system)
+                cached_text = await asyncio.to_thread(cache.get, key)
+            span.cache_result(cached_text is not None)
+            if cached_text is not None:
+                span.finish("ok")
+                yield cached_text
+                return
+
+        chunks, info, status = [], {}, "error"
+
+        def generate() -> AsyncIterator[str]:
+            return llm_generate_stream_async(prompt, llm, top_k, top_p, temp, info, system)
+
+        flights, shared = get_flights(), None
+        start = time.perf_counter()
+        if flights:
+            flight_key = key or make_flight_key(prompt, llm, top_k, top_p, temp, system)
+            stream, shared = flights.stream_async(
+                flight_key, generate, lambda: bool(info.get("done"))
+            )
+        else:
+            stream = generate()
+        if shared:
+            span.coalesce()
+        try:
+            async for chunk in stream:
+                if not chunks:
+                    span.add("first_token", time.perf_counter() - start)
+                chunks.append(chunk)
+                yield chunk
+            done = shared.ok if shared else info.get("done")
+            status = "ok" if done else "error"
+        except (GeneratorExit, asyncio.CancelledError):
+            status = "cancelled"
+            raise
+        finally:
+            await stream.aclose()
+            span.add("request", time.perf_counter() - start)
+            span.finish(status, info)
+
+        if cache and info.get("done") and chunks:
+            await asyncio.to_thread(cache.set, key, "".join(chunks))
+
+
+# ============== Long Documents ==============================================
+
+
+def simplify_text_chunked(
+    text: str,
+    llm: str,
+    use_rules: bool,
+    top_k: int,
+    top_p: float,
+    temp: float,
+    max_chars: int = CHUNK_MAX_CHARS,
+    overlap: int = CHUNK_OVERLAP,
+    workers: int = NUM_PARALLEL,
+) -> str | None:
+    """
+    Simplify a long text chunk by chunk.
+
+    The text is split into chunks of paragraphs (see chunking.split_text) that are simplified
+    concurrently and reassembled in order. Each request gets the end of the previous chunk as
+    context, so that terms are used consistently. Combined with the response cache, only the
+    chunks of an edited document that changed (and the ones right after) are generated again.
+
+    Returns:
+        The simplified text, or None if a chunk could not be simplified.
+    """
+    chunks = split_text(text, max_chars)
+    contexts = chunk_context(chunks, overlap)
+    logger.debug(f"Split text into {len(chunks)} chunks")
+
+    def simplify_chunk(item: tuple[str, str]) -> str:
+        chunk, context = item
+        return simplify_text(chunk, llm, use_rules, top_k, top_p, temp, context)
+
+    results = [None] * len(chunks)
+    for position, result in bounded_map(simplify_chunk, zip(chunks, contexts), workers=workers):
+        if isinstance(result, Exception):
+            logger.error(f"Chunk {position} failed: {result}")
+            result = None
+        results[position] = result
+
+    if any(result is None for result in results):
+        return None
+    return "\n\n".join(results)
+
+
+async def simplify_text_chunked_stream_async(
+    text: str,
+    llm: str,
+    use_rules: bool,
+    top_k: int,
+    top_p: float,
+    temp: float,
+    max_chars: int = CHUNK_MAX_CHARS,
+    overlap: int = CHUNK_OVERLAP,
+    workers: int = NUM_PARALLEL,
+    slot: Callable[[], AsyncContextManager] | None = None,
+) -> AsyncIterator[str]:
+    """
+    Asynchronous version of simplify_text_chunked.
+
+    All chunks are requested concurrently (at most `workers` at a time) and each simplified
+    chunk is yielded as soon as it and all chunks before it are done. If given, every chunk
+    also holds `slot()` while it is generated (e.g. admission.SlotGroup.slot).
+    """
+    chunks = split_text(text, max_chars)
+    contexts = chunk_context(chunks, overlap)
+    semaphore = asyncio.Semaphore(workers)
+
+    async def simplify_chunk(chunk: str, context: str) -> str:
+        start = time.perf_counter()
+        async with semaphore, slot() if slot else nullcontext():
+            observe_queue_wait(time.perf_counter() - start, llm)
+            return await simplify_text_async(chunk, llm, use_rules, top_k, top_p, temp, context)
+
+    tasks = [asyncio.create_task(simplify_chunk(c, ctx)) for c, ctx in zip(chunks, contexts)]
+    try:
+        for position, task in enumerate(tasks):
+            result = await task
+            if result is None:
+                logger.error(f"Chunk {position} failed")
+                return
+            yield ("\n\n" if position else "") + result
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def simplify_text_chunked_async(
+    text: str,
+    llm: str,
+    use_rules: bool,
+    top_k: int,
+    top_p: float,
+    temp: float,
+    max_chars: int = CHUNK_MAX_CHARS,
+    overlap: int = CHUNK_OVERLAP,
+    workers: int = NUM_PARALLEL,
+    slot: Callable[[], AsyncContextManager] | None = None,
+) -> str | None:
+    """Asynchronous version of simplify_text_chunked."""
+    n_chunks = len(split_text(text, max_chars))
+    results = []
+    async for result in simplify_text_chunked_stream_async(
+        text, llm, use_rules, top_k, top_p, temp, max_chars, overlap, workers, slot
+    ):
+        results.append(result)
+    return "".join(results) if len(results) == n_chunks else None
+
+
+# ============== Batches ======================================================
+
+
+def simplify_batch(
+    texts: Iterable[str],
+    llm: str,
+    use_rules: bool,
+    top_k: int,
+    top_p: float,
+    temp: float,
+    batch_size: int = PROMPTS_PER_REQUEST,
+    workers: int = NUM_PARALLEL,
+) -> Iterator[tuple[int, str | None]]:
+    """
+    Simplify many texts, yielding the results as they finish.
+
+    If the LLM API accepts several prompts per request (see llm.supports_batch), the texts are
+    sent in batches of `batch_size` prompts, so the server can process them together and the
+    overhead per request is paid once per batch. Otherwise every text is sent on its own.
+    Either way, at most `workers` requests are in flight and the texts are consumed lazily.
+
+    Yields:
+        tuple[int, str | None]: The position of the text in `texts` and the simplified text
+        (None if it failed), in completion order.
+    """
+    if batch_size <= 1 or not supports_batch():
+
+        def simplify(text: str) -> str:
+            return simplify_text(text, llm, use_rules, top_k, top_p, temp)
+
+        for position, result in bounded_map(simplify, texts, workers=workers):
+            if isinstance(result, Exception):
+                logger.error(f"Text {position} failed: {result}")
+                result = None
+            yield position, result
+        return
+
+    def simplify(batch: list[tuple[int, str]]) -> list[tuple[int, str | None]]:
+        try:
+            return simplify_text_batch(batch, llm, use_rules, top_k, top_p, temp)
+        except Exception as e:
+            # Every text of the batch is reported as failed, so the caller can retry it
+            logger.error(f"Batch of texts {batch[0][0]}-{batch[-1][0]} failed: {e}")
+            return [(position, None) for position, _ in batch]
+
+    batches = batched(enumerate(texts), batch_size)
+    for _, results in bounded_map(simplify, batches, workers=workers):
+        yield from results
+
+
+def simplify_text_batch(
+    batch: list[tuple[int, str]],
+    llm: str,
+    use_rules: bool,
+    top_k: int,
+    top_p: float,
+    temp: float,
+) -> list[tuple[int, str | None]]:
+    """Simplify a batch of (position, text) items with one request to the LLM server."""
+    with RequestSpan(llm or MODEL, "batch") as span:
+        with span.stage("prompt"):
+            prompts = []
+            for _, text in batch:
+                llm, prompt, system = prepare_request(text, llm, use_rules)
+                prompts.append(prompt)
+
+        results = [None] * len(batch)
+        keys = [None] * len(batch)
+        cache = get_cache()
+        if cache:
+            with span.stage("cache"):
+                digest = get_model_digest(llm)
+                for i, prompt in enumerate(prompts):
+                    keys[i] = ResponseCache.make_key(
+                        prompt, llm, digest, top_k, top_p, temp, system
+                    )
+                    results[i] = cache.get(keys[i])
+            span.cache_result(all(result is not None for result in results))
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        info = {}
+        if missing:
+            with span.stage("request"):
+                responses = llm_generate_batch(
+                    [prompts[i] for i in missing], llm, top_k, top_p, temp, info, system
+                )
+            for i, response in zip(missing, responses or []):
+                results[i] = response or None
+                if cache and results[i]:
+                    cache.set(keys[i], results[i])
+        span.finish("ok" if all(results) else "error", info)
+
+        return [(position, result) for (position, _), result in zip(batch, results)]
+
+
+# ============== Prompt =======================================================
+
+
+def make_flight_key(
+    prompt: str, llm: str, top_k: int, top_p: float, temp: float, system: str | None
 ) -> str:
+    """
+    Key of identical requests in flight, used when the response cache (whose key also covers
+    the model digest) is disabled.
+    """
+    return ResponseCache.make_key(prompt, llm, "", top_k, top_p, temp, system)
+
+
+def prepare_request(
+    text: str, llm: str | None, use_rules: bool, context: str | None = None
+) -> tuple[str, str, str | None]:
+    """
+    Return the model to use, the prompt and the system message (None = the one of the model)
+    for a simplification request.
+    """
     if llm is None:
         logger.warning(f"No LLM specified. Setting {MODEL} as default")
         llm = MODEL
-    prompt = create_prompt(text, use_rules)
+    prompt = create_prompt(text, use_rules, context)
+    system = create_system_prompt()
     logger.debug(f"Sent prompt:\n{prompt}")
-    simplified_text = llm_generate(prompt, llm, top_k, top_p, temp)
-    return simplified_text
+    return llm, prompt, system
+
+
+def create_prompt(
+    text: str, use_rules: bool = False, context: str | None = None, layout: str = PROMPT_LAYOUT
+):
+    """
+    Create the prompt for a text in the given layout (see PROMPT_LAYOUT).
+
+    In the "prefix" and "system" layouts, the instructions and criteria come before anything
+    that changes from request to request, so the LLM server can reuse their evaluation.
+    """
+    rules = RULES_LS if use_rules else ""
+    if layout == "text-first":
+        prompt = PROMPT_TEMPLATE.format(rules=rules, text=text)
+        if context:
+            prompt = PROMPT_CONTEXT.format(context=context) + prompt
+        return prompt
+
+    context = PROMPT_CONTEXT.format(context=context) if context else ""
+    if layout == "prefix":
+        return PROMPT_TEMPLATE_PREFIX.format(rules=rules, context=context, text=text)
+    if layout == "system":
+        return PROMPT_TEMPLATE_SYSTEM.format(rules=rules, context=context, text=text)
+    raise ValueError(f"Unknown prompt layout '{layout}'. Choose from: {', '.join(PROMPT_LAYOUTS)}")
 
 
-def create_prompt(text: str, use_rules: bool = False):
-    if use_rules:
-        return PROMPT_TEMPLATE.format(rules=RULES_LS, text=text)
-    else:
-        return PROMPT_TEMPLATE.format(rules="", text=text)
+def create_system_prompt(layout: str = PROMPT_LAYOUT) -> str | None:
+    """Return the system message for the layout, None to keep the one of the model."""
+    return SYSTEM_PROMPT_LS if layout == "system" else None
@@ -0,0 +1,155 @@
+import logging, os
+import re, zlib
+from typing import Iterable
+import numpy as np
+from leichtesprache.parameters import NEAR_DUPLICATE_THRESHOLD
+
+logging.basicConfig(format=os.getenv("LOG_FORMAT", "%(asctime)s [%(levelname)s] %(message)s"))
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
+
+# ============== Near-Duplicate Detection =====================================
+
+RE_WORD = re.compile(r"\w+")
+RE_DIGITS = re.compile(r"\d+")
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64(0xFFFFFFFF)
+# Shingles hashed at once when computing signatures (bounds the memory used)
+MAX_SHINGLES_PER_CHUNK = 2**16
+
+
+def shingle_hashes(text: str, size: int = 3) -> list[int]:
+    """
+    Return the hashes of the word n-grams of a text.
+
+    The text is lowercased and all numbers are replaced by 0, so texts that only differ in a
+    date or a number have the same shingles. Texts shorter than `size` words are one shingle.
+    """
+    words = RE_WORD.findall(RE_DIGITS.sub("0", text.lower()))
+    shingles = [" ".join(words[i : i + size]) for i in range(max(1, len(words) - size + 1))]
+    return [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles]
+
+
+def lsh_params(num_perm: int, threshold: float) -> tuple[int, int]:
+    """
+    Return the number of bands and rows per band of the LSH index.
+
+    Two texts become candidates if all rows of one band of their signatures are equal, which
+    is likely above a similarity of about (1 / bands) ** (1 / rows). That point is put a bit
+    below the threshold, as the candidates are verified afterwards.
+    """
+    target = max(0.0, threshold - 0.1)
+    rows = min(
+        range(1, num_perm + 1),
+        key=lambda r: abs((1 / (num_perm // r)) ** (1 / r) - target),
+    )
+    return num_perm // rows, rows
+
+
+class NearDuplicateIndex:
+    """
+    MinHash LSH index that groups near-identical texts into clusters.
+
+    The similarity of two texts is the Jaccard similarity of their word n-grams, estimated
+    from MinHash signatures. Texts are added in batches, and each one joins the cluster of the
+    first earlier text found with a similarity of at least `threshold`, or starts a new one.
+    Finding the candidates takes constant time per text, so building the index is linear in
+    the number of texts. Only the signatures of the first text of each cluster are kept.
+
+    Clusters are identified by the position of their first text, counted over all batches:
+
+        index = NearDuplicateIndex(0.8)
+        clusters = index.add(texts)
+        first = clusters == np.arange(len(texts))  # Not a near duplicate of an earlier text
+
+    Args:
+        threshold (float, optional): Minimum similarity of near duplicates (0-1). Defaults to NEAR_DUPLICATE_THRESHOLD.
+        num_perm (int, optional): Length of the MinHash signatures. Defaults to 64.
+        shingle_size (int, optional): Number of words per n-gram. Defaults to 3.
+        seed (int, optional): Seed of the hash functions. Defaults to 1.
+    """
+
+    def __init__(
+        self,
+        threshold: float = NEAR_DUPLICATE_THRESHOLD,
+        num_perm: int = 64,
+        shingle_size: int = 3,
+        seed: int = 1,
+    ):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = lsh_params(num_perm, threshold)
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2**32, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 2**32, num_perm, dtype=np.uint64)
+        self._band_weights = rng.integers(1, 2**63, self.rows, dtype=np.uint64)
+        self._buckets = [{} for _ in range(self.bands)]
+        self._signatures = {}
+        self.size = 0
+
+    def signatures(self, texts: list[str]) -> np.ndarray:
+        """Return the MinHash signatures of the texts, one row per text."""
+        result = np.empty((len(texts), self.num_perm), dtype=np.uint64)
+        start = 0
+        while start < len(texts):
+            hashes, offsets, end = [], [], start
+            while end < len(texts) and len(hashes) < MAX_SHINGLES_PER_CHUNK:
+                offsets.append(len(hashes))
+                hashes.extend(shingle_hashes(texts[end], self.shingle_size))
+                end += 1
+            hashes = np.array(hashes, dtype=np.uint64)[:, None]
+            # Universal hashing (a * x + b) mod p, one hash function per column. Overflow wraps
+            with np.errstate(over="ignore"):
+                permuted = ((hashes * self._a + self._b) % MERSENNE_PRIME) & MAX_HASH
+            result[start:end] = np.minimum.reduceat(permuted, offsets, axis=0)
+            start = end
+        return result
+
+    def add(self, texts: Iterable[str]) -> np.ndarray:
+        """
+        Add a batch of texts to the index.
+
+        Returns:
+            np.ndarray: The cluster of each text, as the position of its first text.
+        """
+        texts = [text if isinstance(text, str) else "" for text in texts]
+        signatures = self.signatures(texts)
+        used = signatures[:, : self.bands * self.rows].reshape(len(texts), self.bands, self.rows)
+        with np.errstate(over="ignore"):
+            band_keys = (used * self._band_weights).sum(axis=2)
+
+        clusters = np.empty(len(texts), dtype=np.int64)
+        for i, (signature, keys) in enumerate(zip(signatures, band_keys.tolist())):
+            position = self.size + i
+            cluster = position
+            for band, key in enumerate(keys):
+                candidate = self._buckets[band].get(key)
+                if candidate is not None and self.similarity(signature, candidate) >= (
+                    self.threshold
+                ):
+                    cluster = candidate
+                    break
+            if cluster == position:
+                self._signatures[position] = signature
+            for band, key in enumerate(keys):
+                self._buckets[band].setdefault(key, cluster)
+            clusters[i] = cluster
+        self.size += len(texts)
+        return clusters
+
+    def similarity(self, signature: np.ndarray, cluster: int) -> float:
+        """Estimate the similarity of a text (by its signature) to the first text of a cluster."""
+        return float(np.mean(self._signatures[cluster] == signature))
+
+
+def find_near_duplicates(
+    texts: Iterable[str], threshold: float = NEAR_DUPLICATE_THRESHOLD, **kwargs
+) -> np.ndarray:
+    """
+    Group near-identical texts. Keyword arguments are passed on to NearDuplicateIndex.
+
+    Returns:
+        np.ndarray: The cluster of each text, as the position of the first text of the cluster.
+    """
+    return NearDuplicateIndex(threshold, **kwargs).add(texts)
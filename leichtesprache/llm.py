@@ -1,51 +1,1115 @@
 import logging, os
+import asyncio, threading, time
 import requests, json
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from requests.adapters import HTTPAdapter
 from urllib.parse import urljoin
-from typing import List
-from leichtesprache.parameters import LLMBASEURL, MODEL
+from typing import TYPE_CHECKING, AsyncIterator, Iterator, List
+from leichtesprache.metrics import BACKEND_IN_FLIGHT, BACKEND_UP
+from leichtesprache.parameters import (
+    LLMBASEURL,
+    LLM_HOSTS,
+    LLM_API,
+    LLM_API_KEY,
+    MODEL,
+    MAX_TOKENS,
+    KEEP_ALIVE,
+    KEEP_ALIVE_MODELS,
+    LLM_CONNECT_TIMEOUT,
+    LLM_READ_TIMEOUT,
+    LLM_POOL_SIZE,
+    BACKEND_RETRY_AFTER,
+    MODELS_REFRESH_INTERVAL,
+)
+
+if TYPE_CHECKING:
+    import httpx
 
 logging.basicConfig(format=os.getenv("LOG_FORMAT", "%(asctime)s [%(levelname)s] %(message)s"))
 logger = logging.getLogger(__name__)
 logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
 
-# ============== LLM (Ollama) =================================================
+# ============== HTTP Client ==================================================
+
+
+class LLMClient:
+    """
+    HTTP client for the LLM server that pools and reuses keep-alive connections.
+
+    The underlying urllib3 connection pool is thread-safe, so a single instance can be shared
+    by the Gradio worker threads and the batch tools.
+
+    Args:
+        base_url (str, optional): Base URL of the LLM server API. Defaults to LLMBASEURL.
+        headers (dict, optional): Headers sent with every request, e.g. for authorization.
+        connect_timeout (float, optional): Seconds to wait for a connection to be established.
+        read_timeout (float, optional): Seconds to wait between bytes received from the server.
+        pool_size (int, optional): Maximum number of connections kept open to the server.
+    """
+
+    def __init__(
+        self,
+        base_url: str = LLMBASEURL,
+        headers: dict | None = None,
+        connect_timeout: float = LLM_CONNECT_TIMEOUT,
+        read_timeout: float = LLM_READ_TIMEOUT,
+        pool_size: int = LLM_POOL_SIZE,
+    ):
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, endpoint: str) -> str:
+        return urljoin(self.base_url, endpoint)
+
+    def get(self, endpoint: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(self.url(endpoint), **kwargs)
+
+    def post(self, endpoint: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(self.url(endpoint), **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncLLMClient:
+    """
+    Asynchronous counterpart of LLMClient, based on a shared httpx.AsyncClient session.
+
+    Connections are pooled per event loop. Requests that exceed the pool size wait for a free
+    connection instead of failing, so many concurrent requests can be held open at once.
+    """
+
+    def __init__(
+        self,
+        base_url: str = LLMBASEURL,
+        headers: dict | None = None,
+        connect_timeout: float = LLM_CONNECT_TIMEOUT,
+        read_timeout: float = LLM_READ_TIMEOUT,
+        pool_size: int = LLM_POOL_SIZE,
+    ):
+        self.base_url = base_url
+        # Imported on first use, it is only needed by the asynchronous code paths
+        import httpx
+
+        self.session = httpx.AsyncClient(
+            headers=headers,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout, pool=None),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    def url(self, endpoint: str) -> str:
+        return urljoin(self.base_url, endpoint)
+
+    async def get(self, endpoint: str, **kwargs) -> "httpx.Response":
+        return await self.session.get(self.url(endpoint), **kwargs)
+
+    async def post(self, endpoint: str, **kwargs) -> "httpx.Response":
+        return await self.session.post(self.url(endpoint), **kwargs)
+
+    def stream(self, method: str, endpoint: str, **kwargs):
+        return self.session.stream(method, self.url(endpoint), **kwargs)
+
+    async def send(self, method: str, endpoint: str, **kwargs) -> "httpx.Response":
+        """Send a request and return as soon as the headers arrived (the body is streamed)."""
+        request = self.session.build_request(method, self.url(endpoint), **kwargs)
+        return await self.session.send(request, stream=True)
+
+    async def aclose(self):
+        await self.session.aclose()
+
+
+# ============== LLM APIs =====================================================
+
+
+class LLMAPI:
+    """
+    Request and response format of an LLM server API.
+
+    Responses are translated into the fields of Ollama's /api/generate responses ("response",
+    "done", "done_reason", "prompt_eval_count", "eval_count", ...), which the rest of the
+    package relies on, e.g. for the metrics.
+
+    Args:
+        api_key (str, optional): Sent as bearer token, if the server requires one.
+    """
+
+    name = ""
+    path = ""  # Path of the API below the host URL
+    generate_endpoint = ""
+    models_endpoint = ""
+    can_load_models = False  # Whether models can be loaded and unloaded with requests
+    supports_batch = False  # Whether one request can hold several prompts
+
+    def __init__(self, api_key: str = LLM_API_KEY):
+        self.api_key = api_key
+
+    def base_url(self, host: str) -> str:
+        """Return the base URL of the API on a host. Hosts may include the API path already."""
+        host = host.rstrip("/") + "/"
+        return host if host.endswith("/" + self.path) else urljoin(host, self.path)
+
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def payload(
+        self,
+        prompt: str,
+        model: str,
+        top_k: int,
+        top_p: float,
+        temp: float,
+        stream: bool,
+        system: str | None = None,
+    ) -> dict:
+        raise NotImplementedError
+
+    def parse_response(self, response_dic: dict) -> dict:
+        """Translate a complete (non-streamed) response."""
+        raise NotImplementedError
+
+    def parse_line(self, line: str | bytes) -> dict | None:
+        """Translate a line of a streamed response, None if it holds no data."""
+        raise NotImplementedError
+
+    def batch_payload(
+        self,
+        prompts: List[str],
+        model: str,
+        top_k: int,
+        top_p: float,
+        temp: float,
+        system: str | None = None,
+    ) -> dict:
+        raise NotImplementedError
+
+    def parse_batch_response(self, response_dic: dict, n: int) -> List[dict]:
+        """Translate the response to a batch of `n` prompts into one response per prompt."""
+        raise NotImplementedError
+
+    def parse_models(self, response_dic: dict) -> dict:
+        """Return the models listed by the server as {name: digest}."""
+        raise NotImplementedError
+
+    @staticmethod
+    def usage(response_dic: dict) -> dict:
+        """Return the token counts of a response (prompt_eval_count, eval_count)."""
+        return {}
+
+
+class OllamaAPI(LLMAPI):
+    """Ollama's own API: /api/generate, streamed as newline-delimited JSON, and /api/tags."""
+
+    name = "ollama"
+    path = "api/"
+    generate_endpoint = "generate"
+    models_endpoint = "tags"
+    can_load_models = True
+
+    def payload(
+        self,
+        prompt: str,
+        model: str,
+        top_k: int,
+        top_p: float,
+        temp: float,
+        stream: bool,
+        system: str | None = None,
+    ) -> dict:
+        data = {
+            "model": model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {"temperature": temp, "top_p": top_p, "top_k": top_k},
+        }
+        if system:
+            # Replaces the system message of the Modelfile
+            data["system"] = system
+        keep_alive = get_keep_alive(model)
+        if keep_alive is not None:
+            data["keep_alive"] = keep_alive
+        return data
+
+    def parse_response(self, response_dic: dict) -> dict:
+        return response_dic
+
+    def parse_line(self, line: str | bytes) -> dict | None:
+        return json.loads(line) if line else None
+
+    def parse_models(self, response_dic: dict) -> dict:
+        return {m.get("name"): m.get("digest", "") for m in response_dic.get("models")}
+
+
+class OpenAICompletionsAPI(LLMAPI):
+    """
+    OpenAI-compatible /v1/completions API, as served by vLLM, llama.cpp server, TGI or Ollama.
+
+    Streams are sent as server-sent events ("data: {...}" lines, ending with "data: [DONE]").
+    The model list (/v1/models) has no digests, so the name of the API stands in for them:
+    cached responses are not tied to a version of the model, but kept apart per API.
+    """
+
+    name = "openai"
+    path = "v1/"
+    generate_endpoint = "completions"
+    models_endpoint = "models"
+    supports_batch = True
+
+    def payload(
+        self,
+        prompt: str,
+        model: str,
+        top_k: int,
+        top_p: float,
+        temp: float,
+        stream: bool,
+        system: str | None = None,
+    ) -> dict:
+        data = {
+            "model": model,
+            **self.input(prompt, system),
+            "stream": stream,
+            "temperature": temp,
+            "top_p": top_p,
+            "top_k": top_k,  # Not part of the OpenAI API, but supported by vLLM and llama.cpp
+            "max_tokens": MAX_TOKENS,
+        }
+        if stream:
+            # Send the token counts with the last chunk
+            data["stream_options"] = {"include_usage": True}
+        return data
+
+    def input(self, prompt: str | List[str], system: str | None = None) -> dict:
+        # Plain completions have no system message, so it goes in front of the prompt
+        if system and isinstance(prompt, list):
+            prompt = [f"{system}\n\n{item}" for item in prompt]
+        elif system:
+            prompt = f"{system}\n\n{prompt}"
+        return {"prompt": prompt}
+
+    def text(self, choice: dict) -> str:
+        return choice.get("text") or ""
+
+    def delta(self, choice: dict) -> str:
+        return choice.get("text") or ""
+
+    @staticmethod
+    def usage(response_dic: dict) -> dict:
+        usage = response_dic.get("usage") or {}
+        stats = {
+            "prompt_eval_count": usage.get("prompt_tokens"),
+            "eval_count": usage.get("completion_tokens"),
+        }
+        return {k: v for k, v in stats.items() if v is not None}
+
+    @staticmethod
+    def error(response_dic: dict) -> str:
+        error = response_dic["error"]
+        return error.get("message", str(error)) if isinstance(error, dict) else str(error)
+
+    def parse_response(self, response_dic: dict) -> dict:
+        if "error" in response_dic:
+            return {"error": self.error(response_dic)}
+        choice = response_dic["choices"][0]
+        return {
+            "model": response_dic.get("model"),
+            "response": self.text(choice),
+            "done": True,
+            "done_reason": choice.get("finish_reason"),
+            **self.usage(response_dic),
+        }
+
+    def parse_line(self, line: str | bytes) -> dict | None:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        # Skip empty lines, comments and other fields of the event stream
+        if not line.startswith("data:"):
+            return None
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return {"done": True}
+        response_dic = json.loads(data)
+        if "error" in response_dic:
+            return {"error": self.error(response_dic)}
+        chunk = self.usage(response_dic)
+        if response_dic.get("choices"):
+            choice = response_dic["choices"][0]
+            chunk["response"] = self.delta(choice)
+            if choice.get("finish_reason"):
+                chunk["done_reason"] = choice["finish_reason"]
+        return chunk
+
+    def batch_payload(
+        self,
+        prompts: List[str],
+        model: str,
+        top_k: int,
+        top_p: float,
+        temp: float,
+        system: str | None = None,
+    ) -> dict:
+        # A list of prompts is completed in one request, with one choice per prompt
+        return self.payload(prompts, model, top_k, top_p, temp, stream=False, system=system)
+
+    def parse_batch_response(self, response_dic: dict, n: int) -> List[dict]:
+        if "error" in response_dic:
+            return [{"error": self.error(response_dic)}] * n
+        responses = [{"error": "No choice for this prompt"}] * n
+        for choice in response_dic["choices"]:
+            index = choice.get("index", 0)
+            if 0 <= index < n:
+                responses[index] = {
+                    "response": self.text(choice),
+                    "done": True,
+                    "done_reason": choice.get("finish_reason"),
+                }
+        return responses
+
+    def parse_models(self, response_dic: dict) -> dict:
+        return {m.get("id"): self.name for m in response_dic.get("data")}
+
+
+class OpenAIChatAPI(OpenAICompletionsAPI):
+    """
+    OpenAI-compatible /v1/chat/completions API. The prompt is sent as a user message, so the
+    server applies the chat template of the model.
+    """
+
+    name = "openai-chat"
+    generate_endpoint = "chat/completions"
+    supports_batch = False
+
+    def input(self, prompt: str, system: str | None = None) -> dict:
+        messages = [{"role": "system", "content": system}] if system else []
+        return {"messages": messages + [{"role": "user", "content": prompt}]}
+
+    def text(self, choice: dict) -> str:
+        return (choice.get("message") or {}).get("content") or ""
+
+    def delta(self, choice: dict) -> str:
+        return (choice.get("delta") or {}).get("content") or ""
+
+
+APIS = {api.name: api for api in (OllamaAPI, OpenAICompletionsAPI, OpenAIChatAPI)}
+
+
+def get_api(name: str = LLM_API, **kwargs) -> LLMAPI:
+    """Return the API implementation by name: "ollama", "openai" or "openai-chat"."""
+    if name not in APIS:
+        raise ValueError(f"Unknown LLM API '{name}'. Choose from: {', '.join(APIS)}")
+    return APIS[name](**kwargs)
+
+
+# ============== Backends =====================================================
+
+
+class BackendError(Exception):
+    """The LLM server answered with a server error (5xx)."""
+
+
+class Backend:
+    """
+    One LLM server (host) with its HTTP clients, the models it serves and its health.
+
+    An httpx session is bound to the event loop it was created in, so the asynchronous client
+    is created again when used from a different loop (e.g. consecutive asyncio.run calls in
+    the batch tools).
+
+    Args:
+        host (str): URL of the LLM server.
+        api (LLMAPI): API of the server.
+        **client_kwargs: Arguments for LLMClient and AsyncLLMClient (timeouts, pool size).
+    """
+
+    def __init__(self, host: str, api: LLMAPI, **client_kwargs):
+        self.api = api
+        self.base_url = base_url = api.base_url(host)
+        self.client_kwargs = {"headers": api.headers(), **client_kwargs}
+        self.client = LLMClient(base_url, **self.client_kwargs)
+        self._async_client = None
+        self._async_client_loop = None
+        self.models = {}  # Model name: digest, as listed by the server
+        self.models_updated = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.down_until = 0.0
+        self._lock = threading.Lock()
+        BACKEND_UP.set(1, backend=base_url)
+
+    def async_client(self) -> AsyncLLMClient:
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            self._async_client = AsyncLLMClient(self.base_url, **self.client_kwargs)
+            self._async_client_loop = loop
+        return self._async_client
+
+    @property
+    def healthy(self) -> bool:
+        return time.time() >= self.down_until
+
+    def mark_down(self, reason: Exception):
+        """Take the backend out of the rotation for BACKEND_RETRY_AFTER seconds."""
+        logger.warning(f"LLM backend {self.base_url} is down ({reason!r})")
+        self.down_until = time.time() + BACKEND_RETRY_AFTER
+        BACKEND_UP.set(0, backend=self.base_url)
+
+    def mark_up(self):
+        if self.down_until:
+            logger.info(f"LLM backend {self.base_url} is up again")
+            self.down_until = 0.0
+            BACKEND_UP.set(1, backend=self.base_url)
+
+    def acquire(self):
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+        BACKEND_IN_FLIGHT.inc(backend=self.base_url)
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        BACKEND_IN_FLIGHT.dec(backend=self.base_url)
+
+    def update_models(self, response_dic: dict):
+        self.models = self.api.parse_models(response_dic)
+        self.models_updated = time.time()
+
+    def has_model(self, model: str) -> bool:
+        return model in self.models or f"{model}:latest" in self.models
+
+    def digest(self, model: str) -> str | None:
+        return self.models.get(model, self.models.get(f"{model}:latest"))
+
+    def close(self):
+        self.client.close()
+
+
+class BackendPool:
+    """
+    A pool of LLM servers that share the requests.
+
+    Each request goes to the healthy backend with the fewest requests in flight among those
+    that have the model (according to their model lists, refreshed every MODELS_TTL seconds). If a
+    backend cannot be reached or answers with a server error, it is marked down for
+    BACKEND_RETRY_AFTER seconds and the request is retried on the next backend. Down backends
+    are only tried as a last resort, which also tells when they are up again.
+
+    One refresh of the model lists runs at a time, shared by threads and coroutines: the others
+    go on with the current lists, and only wait for it while no backend has listed its models.
+
+    Args:
+        hosts (List[str]): URLs of the LLM servers.
+        api (LLMAPI, optional): API of the servers. Defaults to LLM_API.
+        **client_kwargs: Arguments for the HTTP clients (timeouts, pool size).
+    """
+
+    MODELS_TTL = 60  # seconds
+    MODELS_TIMEOUT = 10  # seconds, so a slow server does not hold up the requests waiting for it
+
+    def __init__(self, hosts: List[str], api: LLMAPI | None = None, **client_kwargs):
+        self.api = api or get_api()
+        self.backends = [Backend(host, self.api, **client_kwargs) for host in hosts]
+        self._refresh_lock = threading.Lock()
+        self._refreshing = None  # Future of the refresh in flight
+
+    def candidates(self, model: str) -> List[Backend]:
+        """Return the backends to try for a model, best first."""
+        healthy = [backend for backend in self.backends if backend.healthy]
+        # Backends whose model list is unknown might have the model, too
+        with_model = [b for b in healthy if b.has_model(model) or not b.models_updated]
+        preferred = sorted(with_model or healthy, key=lambda b: (b.in_flight, b.requests))
+        others = [b for b in healthy if b not in preferred]
+        down = sorted((b for b in self.backends if not b.healthy), key=lambda b: b.down_until)
+        return preferred + others + down
+
+    def stale(self, backend: Backend) -> bool:
+        return time.time() - backend.models_updated > self.MODELS_TTL and backend.healthy
+
+    def start_refresh(self, force: bool = False) -> tuple[Future | None, List[Backend]]:
+        """
+        Claim the refresh of the stale model lists (all lists if `force`). Down backends are
+        skipped unless forced.
+
+        Returns:
+            tuple[Future | None, List[Backend]]: The future of the refresh in flight (None if
+            nothing is stale) and the backends to refresh, which are empty if another caller
+            is refreshing already. Whoever gets backends must call end_refresh afterwards.
+        """
+        with self._refresh_lock:
+            if self._refreshing is not None:
+                return self._refreshing, []
+            stale = [backend for backend in self.backends if force or self.stale(backend)]
+            if not stale:
+                return None, []
+            self._refreshing = Future()
+            return self._refreshing, stale
+
+    def end_refresh(self):
+        with self._refresh_lock:
+            future, self._refreshing = self._refreshing, None
+        future.set_result(None)
+
+    def must_wait(self, force: bool = False) -> bool:
+        """Whether to wait for a refresh in flight instead of going on with the current lists."""
+        return force or not any(backend.models_updated for backend in self.backends)
+
+    def refresh(self, force: bool = False):
+        """Update the model lists of the backends, if they are older than MODELS_TTL."""
+        future, stale = self.start_refresh(force)
+        if future is None:
+            return
+        if not stale:
+            if self.must_wait(force):
+                future.result()
+            return
+        try:
+            for backend in stale:
+                try:
+                    r = backend.client.get(self.api.models_endpoint, timeout=self.MODELS_TIMEOUT)
+                    r.raise_for_status()
+                    backend.update_models(r.json())
+                    backend.mark_up()
+                except Exception as e:
+                    backend.mark_down(e)
+        finally:
+            self.end_refresh()
+
+    async def refresh_async(self, force: bool = False):
+        """Asynchronous version of refresh. The backends are queried concurrently."""
+
+        async def refresh_backend(backend: Backend):
+            try:
+                r = await backend.async_client().get(
+                    self.api.models_endpoint, timeout=self.MODELS_TIMEOUT
+                )
+                r.raise_for_status()
+                backend.update_models(r.json())
+                backend.mark_up()
+            except Exception as e:
+                backend.mark_down(e)
+
+        future, stale = self.start_refresh(force)
+        if future is None:
+            return
+        if not stale:
+            if self.must_wait(force):
+                await asyncio.wrap_future(future)
+            return
+        try:
+            await asyncio.gather(*(refresh_backend(backend) for backend in stale))
+        finally:
+            self.end_refresh()
+
+    @contextmanager
+    def post(self, model: str, endpoint: str, **kwargs) -> Iterator[requests.Response]:
+        """
+        POST a request for a model to the best backend, failing over to the next ones.
+
+        Used as a context manager, so the backend counts the request as in flight until the
+        response (which is streamed) has been read:
+
+            with pool.post(model, pool.api.generate_endpoint, json=data) as r:
+                ...
+        """
+        self.refresh()
+        last_exc = None
+        for backend in self.candidates(model):
+            backend.acquire()
+            try:
+                r = backend.client.post(endpoint, stream=True, **kwargs)
+                if r.status_code >= 500:
+                    r.close()
+                    raise BackendError(f"{r.status_code} {r.reason}")
+            except (requests.RequestException, BackendError) as e:
+                backend.release()
+                backend.mark_down(e)
+                last_exc = e
+                continue
+            backend.mark_up()
+            try:
+                with r:
+                    yield r
+            finally:
+                backend.release()
+            return
+        raise last_exc or BackendError("No LLM backend configured")
+
+    @asynccontextmanager
+    async def post_async(
+        self, model: str, endpoint: str, **kwargs
+    ) -> AsyncIterator["httpx.Response"]:
+        """Asynchronous version of post."""
+        import httpx
+
+        await self.refresh_async()
+        last_exc = None
+        for backend in self.candidates(model):
+            backend.acquire()
+            try:
+                r = await backend.async_client().send("POST", endpoint, **kwargs)
+                if r.status_code >= 500:
+                    await r.aclose()
+                    raise BackendError(f"{r.status_code} {r.reason_phrase}")
+            except (httpx.TransportError, BackendError) as e:
+                backend.release()
+                backend.mark_down(e)
+                last_exc = e
+                continue
+            backend.mark_up()
+            try:
+                yield r
+            finally:
+                await r.aclose()
+                backend.release()
+            return
+        raise last_exc or BackendError("No LLM backend configured")
+
+    def models(self) -> dict:
+        """Return the models of all healthy backends, with the digest of the first listing."""
+        models = {}
+        for backend in self.backends:
+            if backend.healthy:
+                for name, digest in backend.models.items():
+                    models.setdefault(name, digest)
+        return models
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> BackendPool:
+    """Return the shared pool of LLM backends (LLM_HOSTS, LLM_API), creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = BackendPool(LLM_HOSTS)
+    return _pool
+
+
+def configure_client(
+    hosts: List[str] | None = None, api: LLMAPI | str | None = None, **kwargs
+) -> BackendPool:
+    """
+    Replace the shared pool of LLM backends.
+
+    Args:
+        hosts (List[str], optional): URLs of the LLM servers. Defaults to LLM_HOSTS.
+            A single `base_url` keyword argument is accepted as well.
+        api (LLMAPI | str, optional): API of the servers, or its name. Defaults to LLM_API.
+        **kwargs: Arguments for the HTTP clients (connect_timeout, read_timeout, pool_size).
+    """
+    global _pool
+    if "base_url" in kwargs:
+        hosts = [kwargs.pop("base_url")]
+    if isinstance(api, str):
+        api = get_api(api)
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = BackendPool(hosts or LLM_HOSTS, api, **kwargs)
+    return _pool
+
+
+# ============== LLM ==========================================================
+
+
+def get_keep_alive(model: str) -> str | int | float | None:
+    """
+    Return the keep_alive setting for a model (KEEP_ALIVE_MODELS, else KEEP_ALIVE).
+
+    Ollama accepts a duration ("30m") or a number of seconds (-1 = forever). None leaves it to
+    the server default.
+    """
+    value = str(KEEP_ALIVE_MODELS.get(model, KEEP_ALIVE)).strip()
+    if not value:
+        return None
+    try:
+        return float(value) if "." in value else int(value)
+    except ValueError:
+        return value
+
+
+def update_info(info: dict | None, response_dic: dict):
+    """Copy the stats of a response (durations, token counts) into info."""
+    if info is not None:
+        info.update({k: v for k, v in response_dic.items() if k not in ("response", "context")})
 
 
 def llm_generate(
-    prompt: str, model: str = MODEL, top_k: int = 5, top_p: float = 0.9, temp: float = 0.2
+    prompt: str,
+    model: str = MODEL,
+    top_k: int = 5,
+    top_p: float = 0.9,
+    temp: float = 0.2,
+    info: dict | None = None,
+    system: str | None = None,
 ) -> str:
-    url = urljoin(LLMBASEURL, "generate")
-    data = {
-        "model": model,
-        "prompt": prompt,
-        "stream": False,
-        "options": {"temperature": temp, "top_p": top_p, "top_k": top_k},
-    }
+    """
+    Generate a response with the LLM.
+
+    If a dict is passed as `info`, it is updated with the stats the server returns with the
+    response, e.g. total_duration, load_duration, prompt_eval_count and eval_count (Ollama).
+    OpenAI-compatible servers only report the token counts.
 
+    A `system` message replaces the one of the model (e.g. the SYSTEM of its Modelfile).
+    """
+    pool = get_pool()
+    data = pool.api.payload(prompt, model, top_k, top_p, temp, stream=False, system=system)
+
+    r = None
     try:
-        r = requests.post(url, json=data)
-        response_dic = json.loads(r.text)
+        with pool.post(model, pool.api.generate_endpoint, json=data) as r:
+            response_dic = pool.api.parse_response(json.loads(r.text))
+        if "error" in response_dic:
+            logger.error(f"LLM error: {response_dic['error']}")
+            return None
+        update_info(info, response_dic)
         return response_dic.get("response", "")
 
     except Exception as e:
         logger.error(f"Exception: {e}")
-        logger.debug(f"url:{url}")
         logger.debug(f"Request data:{data}")
         logger.debug(f"Response:{r}")
 
 
-def list_local_models() -> List:
+def llm_generate_stream(
+    prompt: str,
+    model: str = MODEL,
+    top_k: int = 5,
+    top_p: float = 0.9,
+    temp: float = 0.2,
+    info: dict | None = None,
+    system: str | None = None,
+) -> Iterator[str]:
+    """
+    Generate a response with the LLM and yield the text chunks as they arrive.
 
-    url = urljoin(LLMBASEURL, "tags")
+    The lines of the stream are translated by the API into chunks holding the next piece of
+    text in "response". The last chunk has "done" set to true.
+
+    If a dict is passed as `info`, it is updated with the stats of the stream, so
+    info.get("done") tells whether the generation finished successfully.
+    """
+    pool = get_pool()
+    data = pool.api.payload(prompt, model, top_k, top_p, temp, stream=True, system=system)
 
     try:
-        r = requests.get(url)
-        response_dic = json.loads(r.text)
-        models_names = [model.get("name") for model in response_dic.get("models")]
-        return models_names
+        with pool.post(model, pool.api.generate_endpoint, json=data) as r:
+            if r.status_code >= 400:
+                logger.error(f"LLM error: {r.status_code} {r.text}")
+                return
+            stats = {}
+            for line in r.iter_lines():
+                chunk = pool.api.parse_line(line)
+                if not chunk:
+                    continue
+                if "error" in chunk:
+                    logger.error(f"LLM error: {chunk['error']}")
+                    return
+                if chunk.get("response"):
+                    yield chunk["response"]
+                update_info(stats, chunk)
+                if chunk.get("done"):
+                    update_info(info, stats)
+                    return
 
     except Exception as e:
-        logger.error(f"Exception: {e}\nResponse:{response_dic}")
+        logger.error(f"Exception: {e}")
+        logger.debug(f"Request data:{data}")
+
+
+def llm_generate_batch(
+    prompts: List[str],
+    model: str = MODEL,
+    top_k: int = 5,
+    top_p: float = 0.9,
+    temp: float = 0.2,
+    info: dict | None = None,
+    system: str | None = None,
+) -> List[str | None] | None:
+    """
+    Generate the responses to several prompts with one request.
+
+    Only supported by APIs that accept a batch of prompts (see supports_batch), which lets
+    servers with continuous batching (e.g. vLLM) process them together on the GPU. If a dict
+    is passed as `info`, it is updated with the token counts of the whole batch.
+
+    Returns:
+        List[str | None] | None: One response per prompt (None if it failed), or None if the
+        request failed.
+    """
+    pool = get_pool()
+    if not pool.api.supports_batch:
+        logger.error(f"The {pool.api.name} API does not support batches of prompts")
+        return None
+    data = pool.api.batch_payload(prompts, model, top_k, top_p, temp, system=system)
+
+    r = None
+    try:
+        with pool.post(model, pool.api.generate_endpoint, json=data) as r:
+            response_dic = json.loads(r.text)
+        responses = pool.api.parse_batch_response(response_dic, len(prompts))
+        errors = {response["error"] for response in responses if "error" in response}
+        for error in errors:
+            logger.error(f"LLM error: {error}")
+        if info is not None:
+            update_info(info, {"model": model, "done": not errors, **pool.api.usage(response_dic)})
+        return [response.get("response") for response in responses]
+
+    except Exception as e:
+        logger.error(f"Exception: {e}")
+        logger.debug(f"Request data:{data}")
+        logger.debug(f"Response:{r}")
+
+
+def supports_batch() -> bool:
+    """Whether the LLM API can generate several prompts with one request (llm_generate_batch)."""
+    return get_pool().api.supports_batch
+
+
+async def llm_generate_async(
+    prompt: str,
+    model: str = MODEL,
+    top_k: int = 5,
+    top_p: float = 0.9,
+    temp: float = 0.2,
+    info: dict | None = None,
+    system: str | None = None,
+) -> str:
+    """Asynchronous version of llm_generate."""
+    pool = get_pool()
+    data = pool.api.payload(prompt, model, top_k, top_p, temp, stream=False, system=system)
+
+    r = None
+    try:
+        async with pool.post_async(model, pool.api.generate_endpoint, json=data) as r:
+            response_dic = pool.api.parse_response(json.loads(await r.aread()))
+        if "error" in response_dic:
+            logger.error(f"LLM error: {response_dic['error']}")
+            return None
+        update_info(info, response_dic)
+        return response_dic.get("response", "")
+
+    except Exception as e:
+        logger.error(f"Exception: {e!r}")
+        logger.debug(f"Request data:{data}")
+        logger.debug(f"Response:{r}")
+
+
+async def llm_generate_stream_async(
+    prompt: str,
+    model: str = MODEL,
+    top_k: int = 5,
+    top_p: float = 0.9,
+    temp: float = 0.2,
+    info: dict | None = None,
+    system: str | None = None,
+) -> AsyncIterator[str]:
+    """Asynchronous version of llm_generate_stream."""
+    pool = get_pool()
+    data = pool.api.payload(prompt, model, top_k, top_p, temp, stream=True, system=system)
+
+    try:
+        async with pool.post_async(model, pool.api.generate_endpoint, json=data) as r:
+            if r.status_code >= 400:
+                logger.error(f"LLM error: {r.status_code} {(await r.aread()).decode()}")
+                return
+            stats = {}
+            async for line in r.aiter_lines():
+                chunk = pool.api.parse_line(line)
+                if not chunk:
+                    continue
+                if "error" in chunk:
+                    logger.error(f"LLM error: {chunk['error']}")
+                    return
+                if chunk.get("response"):
+                    yield chunk["response"]
+                update_info(stats, chunk)
+                if chunk.get("done"):
+                    update_info(info, stats)
+                    return
+
+    except Exception as e:
+        logger.error(f"Exception: {e!r}")
+        logger.debug(f"Request data:{data}")
+
+
+def list_local_models() -> List:
+    """Return the models available on the LLM backends, an empty list if none of them answered."""
+    pool = get_pool()
+    pool.refresh(force=True)
+    if not any(backend.healthy for backend in pool.backends):
+        logger.error("No LLM backend available")
+    return list(pool.models())
+
+
+async def list_local_models_async() -> List:
+    """Asynchronous version of list_local_models."""
+    pool = get_pool()
+    await pool.refresh_async(force=True)
+    if not any(backend.healthy for backend in pool.backends):
+        logger.error("No LLM backend available")
+    return list(pool.models())
+
+
+_discovery_thread = None
+_models_discovered = threading.Event()
+
+
+def discover_models(interval: float = MODELS_REFRESH_INTERVAL) -> threading.Thread:
+    """
+    Keep the model lists of the LLM backends up to date in a background thread.
+
+    The lists are refreshed right away and then every `interval` seconds, so available_models
+    answers without waiting for the servers. Calling it again returns the running thread.
+    """
+    global _discovery_thread
+
+    def refresh():
+        while True:
+            get_pool().refresh(force=True)
+            _models_discovered.set()
+            time.sleep(interval)
+
+    with _pool_lock:
+        if _discovery_thread is None:
+            _discovery_thread = threading.Thread(target=refresh, name="discovery", daemon=True)
+            _discovery_thread.start()
+    return _discovery_thread
+
+
+def available_models(wait: float = 0) -> List[str]:
+    """
+    Return the models available on the LLM backends, as of the last refresh of their lists.
+
+    Waits up to `wait` seconds for the first refresh of discover_models. Returns an empty list
+    if no list is known yet.
+    """
+    _models_discovered.wait(wait)
+    return list(get_pool().models())
+
+
+def load_model(model: str) -> bool:
+    """
+    Load a model into memory on the LLM servers that have it, without generating anything.
+
+    Ollama loads a model on the first request for it, which can take several seconds. Loading
+    it ahead of time keeps that delay away from the first user. It also renews the keep_alive
+    of an already loaded model. Servers with other APIs load their models at startup, so
+    nothing is done for them.
+    """
+    pool = get_pool()
+    if not pool.api.can_load_models:
+        return False
+
+    data = {"model": model}
+    keep_alive = get_keep_alive(model)
+    if keep_alive is not None:
+        data["keep_alive"] = keep_alive
+
+    pool.refresh()
+    loaded = False
+    for backend in pool.backends:
+        if not backend.healthy or (backend.models_updated and not backend.has_model(model)):
+            continue
+        start = time.time()
+        try:
+            r = backend.client.post("generate", json=data)
+            r.raise_for_status()
+            logger.info(
+                f"Loaded model {model} on {backend.base_url} in {time.time() - start:.1f}s"
+            )
+            loaded = True
+
+        except Exception as e:
+            logger.error(f"Exception: {e}")
+    return loaded
+
+
+def warm_up(models: List[str], background: bool = True) -> threading.Thread | None:
+    """
+    Load the models one after another, in a background thread if `background` is set.
+
+    Returns:
+        threading.Thread | None: The background thread, None if the models were loaded already.
+    """
+    models = [model for model in models if model]
+
+    def load_all():
+        for model in models:
+            load_model(model)
+
+    if not background:
+        load_all()
+        return None
+    thread = threading.Thread(target=load_all, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def unload_model(model: str) -> bool:
+    """
+    Ask the LLM servers to unload a model from memory right away.
+
+    Ollama keeps a model loaded for a while after the last request (keep_alive). Unloading it
+    when it is no longer needed frees the memory for the next model. Only supported by Ollama.
+    """
+    pool = get_pool()
+    if not pool.api.can_load_models:
+        return False
+
+    unloaded = False
+    for backend in pool.backends:
+        if not backend.healthy or (backend.models_updated and not backend.has_model(model)):
+            continue
+        try:
+            r = backend.client.post("generate", json={"model": model, "keep_alive": 0})
+            r.raise_for_status()
+            unloaded = True
+
+        except Exception as e:
+            logger.error(f"Exception: {e}")
+    return unloaded
+
+
+def get_model_digest(model: str) -> str:
+    """
+    Return the digest of a local model as listed by the server, or "" if it is unknown.
+
+    The digest identifies the exact model weights and template behind a model name. The lists
+    of the backends are cached for BackendPool.MODELS_TTL seconds.
+    """
+    pool = get_pool()
+    pool.refresh()
+    return _find_digest(pool, model)
+
+
+async def get_model_digest_async(model: str) -> str:
+    """Asynchronous version of get_model_digest."""
+    pool = get_pool()
+    await pool.refresh_async()
+    return _find_digest(pool, model)
+
+
+def _find_digest(pool: BackendPool, model: str) -> str:
+    for backend in pool.backends:
+        digest = backend.digest(model)
+        if digest is not None:
+            return digest
+    return ""
 
 
 if __name__ == "__main__":
@@ -0,0 +1,332 @@
+import logging, os
+import asyncio, json, threading, time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List
+from leichtesprache.parameters import METRICS_LOG
+
+logging.basicConfig(format=os.getenv("LOG_FORMAT", "%(asctime)s [%(levelname)s] %(message)s"))
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
+
+# ============== Metrics Registry =============================================
+
+# Seconds. Covers cache lookups as well as long generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKENS_PER_SEC_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: List[str], values: tuple, extra: str = "") -> str:
+    labels = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Metric:
+    """Base class of a metric with labels, rendered in the Prometheus text format."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: List[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = list(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{format_labels(self.labels, key)} {value}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, value: float = 1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self.key(labels)] = value
+
+    def inc(self, value: float = 1, **labels):
+        key = self.key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def dec(self, value: float = 1, **labels):
+        self.inc(-value, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self, name: str, help: str, labels: List[str] = (), buckets: tuple = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        with self._lock:
+            counts, total, n = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, n + 1)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = {
+                key: (list(counts), total, n) for key, (counts, total, n) in self._values.items()
+            }
+        for key, (counts, total, n) in sorted(values.items()):
+            for bound, count in zip(self.buckets, counts):
+                labels = format_labels(self.labels, key, f'le="{bound}"')
+                yield f"{self.name}_bucket{labels} {count}"
+            labels = format_labels(self.labels, key, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {n}"
+            yield f"{self.name}_sum{format_labels(self.labels, key)} {total}"
+            yield f"{self.name}_count{format_labels(self.labels, key)} {n}"
+
+
+class MetricsRegistry:
+    """Collection of metrics, rendered together for the metrics endpoint."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS = REGISTRY.register(
+    Counter("ls_requests_total", "Simplification requests by result.", ["model", "mode", "status"])
+)
+REQUESTS_IN_PROGRESS = REGISTRY.register(
+    Gauge("ls_requests_in_progress", "Simplification requests being processed.", ["model"])
+)
+QUEUE_LENGTH = REGISTRY.register(
+    Gauge("ls_queue_length", "Requests waiting for a free generation slot.", ["model"])
+)
+BACKEND_IN_FLIGHT = REGISTRY.register(
+    Gauge("ls_backend_requests_in_flight", "Requests in flight per LLM backend.", ["backend"])
+)
+BACKEND_UP = REGISTRY.register(
+    Gauge(
+        "ls_backend_up",
+        "Whether an LLM backend is considered healthy (1) or down (0).",
+        ["backend"],
+    )
+)
+CACHE_REQUESTS = REGISTRY.register(
+    Counter(
+        "ls_cache_requests_total", "Response cache lookups (hit or miss).", ["model", "result"]
+    )
+)
+COALESCED_REQUESTS = REGISTRY.register(
+    Counter(
+        "ls_coalesced_requests_total",
+        "Requests that shared the generation of an identical request in flight.",
+        ["model"],
+    )
+)
+STAGE_DURATION = REGISTRY.register(
+    Histogram(
+        "ls_stage_duration_seconds",
+        "Time spent in each stage of a simplification request.",
+        ["model", "stage"],
+    )
+)
+TOKENS = REGISTRY.register(
+    Counter(
+        "ls_tokens_total", "Tokens evaluated by the LLM (prompt or generated).", ["model", "kind"]
+    )
+)
+TOKENS_PER_SEC = REGISTRY.register(
+    Histogram(
+        "ls_generation_tokens_per_second",
+        "Generation speed of the LLM.",
+        ["model"],
+        buckets=TOKENS_PER_SEC_BUCKETS,
+    )
+)
+
+# ============== Request Spans ================================================
+
+# Durations reported by Ollama with the response (in nanoseconds), by stage name
+OLLAMA_DURATIONS = {
+    "load": "load_duration",
+    "prompt_eval": "prompt_eval_duration",
+    "eval": "eval_duration",
+    "server": "total_duration",
+}
+
+
+class RequestSpan:
+    """
+    Timing of a single simplification request.
+
+    The stages measured on the client (prompt building, cache lookup, queue wait, the request
+    to the LLM server and the first token of a stream) are combined with the durations Ollama
+    reports in its response (model load, prompt evaluation, generation). The time of the
+    request not spent on the server is recorded as "network".
+
+    Usage:
+
+        with RequestSpan(model, "stream") as span:
+            with span.stage("prompt"):
+                ...
+            span.finish("ok", info)
+
+    A span left without being finished (e.g. by an exception) is finished with the status
+    "error", or "cancelled" if the request was cancelled.
+    """
+
+    def __init__(self, model: str, mode: str = "generate"):
+        self.model = model
+        self.mode = mode
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.cache = None
+        self.coalesced = False
+        self.finished = False
+        REQUESTS_IN_PROGRESS.inc(model=self.model)
+
+    def __enter__(self) -> "RequestSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None and issubclass(exc_type, (GeneratorExit, asyncio.CancelledError)):
+            self.finish("cancelled")
+        else:
+            self.finish("error")
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def cache_result(self, hit: bool):
+        self.cache = "hit" if hit else "miss"
+        CACHE_REQUESTS.inc(model=self.model, result=self.cache)
+
+    def coalesce(self):
+        """Mark the request as served by the generation of an identical request in flight."""
+        self.coalesced = True
+        COALESCED_REQUESTS.inc(model=self.model)
+
+    def finish(self, status: str, info: dict | None = None):
+        """Record the metrics of the request. `info` holds the stats returned by Ollama."""
+        if self.finished:
+            return
+        self.finished = True
+        REQUESTS_IN_PROGRESS.dec(model=self.model)
+
+        stages = dict(self.stages)
+        info = info or {}
+        for stage, field in OLLAMA_DURATIONS.items():
+            if info.get(field):
+                stages[stage] = info[field] / 1e9
+        if "request" in stages and "server" in stages:
+            stages["network"] = max(0.0, stages["request"] - stages["server"])
+        stages["total"] = self.elapsed()
+        for stage, seconds in stages.items():
+            STAGE_DURATION.observe(seconds, model=self.model, stage=stage)
+
+        tokens_per_sec = None
+        prompt_tokens, eval_tokens = info.get("prompt_eval_count"), info.get("eval_count")
+        if prompt_tokens:
+            TOKENS.inc(prompt_tokens, model=self.model, kind="prompt")
+        if eval_tokens:
+            TOKENS.inc(eval_tokens, model=self.model, kind="generated")
+            if info.get("eval_duration"):
+                tokens_per_sec = eval_tokens / (info["eval_duration"] / 1e9)
+                TOKENS_PER_SEC.observe(tokens_per_sec, model=self.model)
+        REQUESTS.inc(model=self.model, mode=self.mode, status=status)
+
+        if METRICS_LOG:
+            record = {
+                "model": self.model,
+                "mode": self.mode,
+                "status": status,
+                "cache": self.cache,
+                "coalesced": self.coalesced,
+                **{f"{stage}_ms": round(seconds * 1000, 1) for stage, seconds in stages.items()},
+                "prompt_tokens": prompt_tokens,
+                "eval_tokens": eval_tokens,
+                "tokens_per_sec": round(tokens_per_sec, 1) if tokens_per_sec else None,
+            }
+            logger.info(json.dumps(record))
+
+
+def observe_queue_wait(seconds: float, model: str):
+    """Record the time a request waited for a free slot before being processed."""
+    STAGE_DURATION.observe(seconds, model=model, stage="queue")
+
+
+# ============== Metrics Endpoint =============================================
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0].rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve the metrics in the Prometheus text format on http://host:port/metrics."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
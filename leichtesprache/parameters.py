@@ -6,6 +6,21 @@ LANGUAGE = "de"
 
 LLMBASEURL = urljoin(os.getenv("OLLAMA_HOST", "http://localhost:11434"), "api/")
 
+# API of the LLM servers: "ollama" (/api/generate), or for OpenAI-compatible servers such as
+# vLLM, llama.cpp server or TGI "openai" (/v1/completions) or "openai-chat" (/v1/chat/completions)
+LLM_API = os.getenv("LS_LLM_API", "ollama")
+LLM_API_KEY = os.getenv("LS_LLM_API_KEY", "")
+# Maximum number of tokens generated per request by OpenAI-compatible servers
+MAX_TOKENS = int(os.getenv("LS_MAX_TOKENS", 1024))
+
+# Several hosts can share the requests, e.g. LS_LLM_HOSTS="http://gpu1:11434,http://gpu2:11434".
+# Each request goes to the least busy host that has the model. A failing host is skipped for
+# BACKEND_RETRY_AFTER seconds. Defaults to OLLAMA_HOST
+LLM_HOSTS = [
+    host.strip() for host in os.getenv("LS_LLM_HOSTS", "").split(",") if host.strip()
+] or [os.getenv("OLLAMA_HOST", "http://localhost:11434")]
+BACKEND_RETRY_AFTER = float(os.getenv("LS_BACKEND_RETRY_AFTER", 30))
+
 # First on the list is used as default
 LLM_CHOICES = [
     "llama3.1-leichte-sprache:fs",
@@ -19,14 +34,93 @@ LLM_CHOICES = [
 ]
 MODEL = os.getenv("OLLAMA_MODEL", LLM_CHOICES[0])
 
+# How long Ollama keeps a model loaded after a request, e.g. "30m", "2h" or -1 (forever).
+# Empty = server default (OLLAMA_KEEP_ALIVE). LS_KEEP_ALIVE_MODELS sets it per model,
+# e.g. "llama3.1-leichte-sprache:fs=2h,llama3.2-leichte-sprache:fs=10m"
+KEEP_ALIVE = os.getenv("LS_KEEP_ALIVE", "")
+KEEP_ALIVE_MODELS = dict(
+    item.strip().rsplit("=", 1)
+    for item in os.getenv("LS_KEEP_ALIVE_MODELS", "").split(",")
+    if "=" in item
+)
+
+# The GUI discovers the available models in the background every MODELS_REFRESH_INTERVAL seconds.
+# At startup it waits at most MODELS_DISCOVERY_WAIT seconds for them, then starts with LLM_CHOICES
+MODELS_REFRESH_INTERVAL = float(os.getenv("LS_MODELS_REFRESH_INTERVAL", 60))
+MODELS_DISCOVERY_WAIT = float(os.getenv("LS_MODELS_DISCOVERY_WAIT", 2))
+
+# Models loaded when the GUI starts: "none", "default" (the default model) or "all"
+WARMUP = os.getenv("LS_WARMUP", "default")
+
+# HTTP connection to the LLM server. Timeouts in seconds
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", 300))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", 32))
+
 # Set for processing tools as well as for GUI default value
 USE_RULES = False
 
+# Layout of the prompt: "text-first" (the text before the criteria), "prefix" (instructions and
+# criteria first, then the text) or "system" (instructions and criteria in the system message).
+# With "prefix" and "system" all prompts start the same, so the LLM server can reuse that part
+PROMPT_LAYOUT = os.getenv("LS_PROMPT_LAYOUT", "text-first")
+
 # LLM default parameters
 TOP_K = 2
 TOP_P = 0.9
 TEMP = 0.2
 
+# Batch processing. Match the number of parallel requests to OLLAMA_NUM_PARALLEL on the servers
+# (by default OLLAMA_NUM_PARALLEL requests per LLM host)
+NUM_PARALLEL = int(
+    os.getenv("LS_NUM_PARALLEL", int(os.getenv("OLLAMA_NUM_PARALLEL", 4)) * len(LLM_HOSTS))
+)
+# Prompts sent with one request by the batch tools, if the LLM API supports it (LS_LLM_API=openai)
+PROMPTS_PER_REQUEST = int(os.getenv("LS_PROMPTS_PER_REQUEST", 16))
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0  # seconds, doubled on every retry
+
+# Maximum number of simplification requests processed at once by the GUI (None = unlimited)
+UI_CONCURRENCY_LIMIT = int(os.getenv("LS_UI_CONCURRENCY_LIMIT", 0)) or None
+
+# Admission control of the GUI: concurrent generations per model (0 = unlimited), number of
+# requests per model that may wait for a slot, and how long they may wait (seconds, 0 = no limit).
+# Requests beyond the queue are rejected right away
+MAX_CONCURRENT_PER_MODEL = int(os.getenv("LS_MAX_CONCURRENT_PER_MODEL", NUM_PARALLEL))
+MAX_QUEUE = int(os.getenv("LS_MAX_QUEUE", 16))
+QUEUE_TIMEOUT = float(os.getenv("LS_QUEUE_TIMEOUT", 120))
+
+# Headless JSON server (python -m leichtesprache.server): address, simplification requests
+# processed at once (further requests wait in the queue above, 0 = unlimited) and maximum
+# number of texts per bulk request
+SERVER_HOST = os.getenv("LS_SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("LS_SERVER_PORT", 8080))
+SERVER_CONCURRENCY = int(os.getenv("LS_SERVER_CONCURRENCY", NUM_PARALLEL))
+SERVER_MAX_TEXTS = int(os.getenv("LS_SERVER_MAX_TEXTS", 1000))
+
+# Identical requests in flight (same prompt, model and parameters) share one generation
+COALESCE = os.getenv("LS_COALESCE", "1").lower() in ("1", "true", "yes")
+
+# Long texts can be split into chunks of paragraphs that are simplified in parallel.
+# The end of the previous chunk (CHUNK_OVERLAP characters) is given to the LLM as context
+SPLIT_PARAGRAPHS = False
+CHUNK_MAX_CHARS = int(os.getenv("LS_CHUNK_MAX_CHARS", 1500))
+CHUNK_OVERLAP = int(os.getenv("LS_CHUNK_OVERLAP", 200))
+
+# Minimum similarity (0-1, Jaccard similarity of the word n-grams) of texts the dataset tools
+# treat as near duplicates, e.g. notices that only differ in a date or a municipality name
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("LS_NEAR_DUPLICATE_THRESHOLD", 0.8))
+
+# Response cache shared by the GUI and the tools. Empty path = disabled
+CACHE_PATH = os.getenv("LS_CACHE_PATH", "")
+CACHE_MAX_ENTRIES = int(os.getenv("LS_CACHE_MAX_ENTRIES", 100_000))
+CACHE_MAX_AGE_DAYS = float(os.getenv("LS_CACHE_MAX_AGE_DAYS", 30))
+
+# Metrics in the Prometheus text format on http://host:LS_METRICS_PORT/metrics (0 = disabled).
+# LS_METRICS_LOG=1 also logs the timings of every request as a JSON line
+METRICS_PORT = int(os.getenv("LS_METRICS_PORT", 0))
+METRICS_LOG = os.getenv("LS_METRICS_LOG", "").lower() in ("1", "true", "yes")
+
 # Other Features
 EXPORT_PATH = "exports"
 
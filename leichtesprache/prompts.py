@@ -9,12 +9,7 @@ Text:
 {text}
 """
 
-PROMPT_TEMPLATE = """
-Bitte schreibe den folgenden schwer verständlichen Text unter Berücksichtigung der genannten Kriterien vollständig in Leichte Sprache um.
-Text:
-{text}
-
-Achte bei der Umformulierung in Leichte Sprache auf folgende Kriterien:
+CRITERIA_LS = """Achte bei der Umformulierung in Leichte Sprache auf folgende Kriterien:
 Verwende aktive Sprache anstelle von passiver Sprache.
 Verwende ausschließlich Wörter aus dem alltagsnahen Sprachgebrauch.
 Vermeide Fremdwörter und Fachwörter oder erkläre diese kurz.
@@ -29,6 +24,43 @@ Verwende Titel und Untertitel, um den Text zu gliedern.
 Stelle Aufzählungen als Stichpunkte dar.
 """
 
+PROMPT_TEMPLATE = """
+Bitte schreibe den folgenden schwer verständlichen Text unter Berücksichtigung der genannten Kriterien vollständig in Leichte Sprache um.
+Text:
+{text}
+
+""" + CRITERIA_LS
+
+# Layouts with a static beginning, so that the LLM server can reuse the evaluated prompt
+# (KV cache) of the previous request and only evaluates the part after the text starts.
+# "prefix": instructions and criteria first, then the text
+PROMPT_TEMPLATE_PREFIX = (
+    """
+Bitte schreibe den schwer verständlichen Text am Ende unter Berücksichtigung der folgenden Kriterien vollständig in Leichte Sprache um.
+
+"""
+    + CRITERIA_LS
+    + """{context}
+Text:
+{text}
+"""
+)
+
+# "system": instructions and criteria in the system message, the text in the user message
+SYSTEM_PROMPT_LS = SYSTEM_MESSAGE_LS + "\n\n" + CRITERIA_LS
+
+PROMPT_TEMPLATE_SYSTEM = """Bitte schreibe den folgenden schwer verständlichen Text unter Berücksichtigung der genannten Kriterien vollständig in Leichte Sprache um.
+{context}
+Text:
+{text}
+"""
+
+PROMPT_CONTEXT = """
+Der Text ist ein Abschnitt aus einem längeren Dokument.
+Davor steht im Dokument (nur zur Orientierung, nicht umschreiben):
+{context}
+"""
+
 
 RULES_LS = """
 
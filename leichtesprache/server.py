@@ -0,0 +1,385 @@
+import logging, os
+import argparse, json, sys, threading, time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, Iterator
+import leichtesprache.parameters as p
+from leichtesprache.admission import QueueFullError, QueueTimeoutError
+from leichtesprache.chunking import split_text
+from leichtesprache.core import (
+    simplify_batch,
+    simplify_text,
+    simplify_text_chunked,
+    simplify_text_stream,
+)
+from leichtesprache.llm import available_models, discover_models, warm_up
+from leichtesprache.metrics import REGISTRY, observe_queue_wait
+
+logging.basicConfig(format=os.getenv("LOG_FORMAT", "%(asctime)s [%(levelname)s] %(message)s"))
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
+
+# ============== Request Slots ================================================
+
+
+class Slots:
+    """
+    Limits the number of generations run at once by the server, with a bounded wait queue.
+
+    The thread-based counterpart of admission.AdmissionController, shared by all models: the
+    request threads wait for free slots for at most `timeout` seconds, and are rejected
+    right away if `max_queue` requests are already waiting. A request that runs several
+    generations concurrently (chunks of a long text, bulk requests) takes one slot for each.
+
+    Args:
+        limit (int): Generations run at once. 0 = unlimited.
+        max_queue (int): Requests that may wait for a slot.
+        timeout (float): Seconds a request may wait for a slot. 0 = no limit.
+    """
+
+    def __init__(self, limit: int, max_queue: int, timeout: float):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._changed = threading.Condition()
+
+    @contextmanager
+    def acquire(self, model: str, count: int = 1):
+        """
+        Hold `count` slots while processing a request for the model. Yields the number of
+        slots held, which is less than `count` if the limit is lower.
+
+        Raises:
+            QueueFullError: If all slots are taken and the wait queue is full.
+            QueueTimeoutError: If no slot became free within the timeout.
+        """
+        start = time.perf_counter()
+        count = min(count, self.limit) if self.limit else count
+        with self._changed:
+            if self.limit and self.active + count > self.limit:
+                if self.waiting >= self.max_queue:
+                    raise QueueFullError(
+                        "Too many requests at the moment. Please try again later."
+                    )
+                self.waiting += 1
+                try:
+                    if not self._changed.wait_for(
+                        lambda: self.active + count <= self.limit, self.timeout or None
+                    ):
+                        raise QueueTimeoutError(
+                            f"No free slot within {self.timeout:.0f}s. Please try again later."
+                        )
+                finally:
+                    self.waiting -= 1
+            self.active += count
+        observe_queue_wait(time.perf_counter() - start, model)
+        try:
+            yield count
+        finally:
+            with self._changed:
+                self.active -= count
+                # Waiting requests may need different numbers of slots
+                self._changed.notify_all()
+
+    def stats(self) -> dict:
+        return {"active": self.active, "waiting": self.waiting, "limit": self.limit}
+
+
+# ============== HTTP Server ==================================================
+
+
+class SimplifyServer(ThreadingHTTPServer):
+    """HTTP server handling each connection in its own thread, with shared request slots."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        concurrency: int = p.SERVER_CONCURRENCY,
+        max_queue: int = p.MAX_QUEUE,
+        queue_timeout: float = p.QUEUE_TIMEOUT,
+        max_texts: int = p.SERVER_MAX_TEXTS,
+    ):
+        super().__init__(address, SimplifyHandler)
+        self.slots = Slots(concurrency, max_queue, queue_timeout)
+        self.max_texts = max_texts
+
+    def handle_error(self, request, client_address):
+        # Clients closing a keep-alive connection are no error
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            logger.debug(f"Connection of {client_address[0]} closed")
+            return
+        super().handle_error(request, client_address)
+
+
+class SimplifyHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of the simplification.
+
+    GET  /health            Status and load of the server (for load balancers).
+    GET  /models            Models available on the LLM servers.
+    GET  /metrics           Metrics in the Prometheus text format.
+    POST /simplify          {"text": ...} -> {"text": ...}
+    POST /simplify/batch    {"texts": [...]} -> {"texts": [...], "failed": n}
+    POST /simplify/stream   {"text": ...} -> NDJSON {"text": chunk} lines as generated, or
+                            {"texts": [...]} -> NDJSON {"index": i, "text": ...} lines as the
+                            texts are done. The last line is {"done": true, ...}.
+
+    Optional request fields: model, use_rules, top_k, top_p, temp and split (simplify a long
+    text in chunks of paragraphs, not for batches). Failed texts are returned as null.
+
+    Requests with several texts or chunks run up to NUM_PARALLEL generations at once, and take
+    one request slot for each, so that at most `concurrency` generations run on the LLM servers.
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "leichtesprache"
+    # Headers and body are separate writes, which Nagle's algorithm would delay by ~40 ms
+    disable_nagle_algorithm = True
+    server: SimplifyServer
+
+    MAX_BODY = 32 * 1024 * 1024
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    # ---- Routing ----
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path == "/health":
+            self.send_json(200, {"status": "ok", **self.server.slots.stats()})
+        elif path == "/models":
+            self.send_json(200, {"models": available_models()})
+        elif path == "/metrics":
+            body = REGISTRY.render().encode("utf-8")
+            self.send_body(200, body, "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self.send_json(404, {"error": f"Not found: {path}"})
+
+    def do_POST(self):
+        path = self.path.split("?")[0].rstrip("/")
+        routes = {
+            "/simplify": self.simplify,
+            "/simplify/batch": self.simplify_batch,
+            "/simplify/stream": self.simplify_stream,
+        }
+        if path not in routes:
+            self.close_connection = True
+            self.send_json(404, {"error": f"Not found: {path}"})
+            return
+        try:
+            request = self.read_json()
+            options = parse_options(request)
+            fan_out = get_fan_out(path, request, self.server.max_texts)
+            with self.server.slots.acquire(options["llm"], fan_out) as workers:
+                routes[path](request, options, workers)
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+        except (QueueFullError, QueueTimeoutError) as e:
+            self.send_json(503, {"error": str(e)}, {"Retry-After": "5"})
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("Client closed the connection")
+            self.close_connection = True
+
+    # ---- Endpoints ----
+
+    def simplify(self, request: dict, options: dict, workers: int):
+        text = get_text(request)
+        if request.get("split"):
+            simplified_text = simplify_text_chunked(text, **options, workers=workers)
+        else:
+            simplified_text = simplify_text(text, **options)
+        if simplified_text is None:
+            self.send_json(502, {"error": "The LLM server did not return a response."})
+            return
+        self.send_json(200, {"text": simplified_text, "model": options["llm"]})
+
+    def simplify_batch(self, request: dict, options: dict, workers: int):
+        texts = get_texts(request, self.server.max_texts)
+        results = [None] * len(texts)
+        for position, result in simplify_batch(texts, **options, workers=workers):
+            results[position] = result
+        failed = sum(result is None for result in results)
+        self.send_json(200, {"texts": results, "failed": failed, "model": options["llm"]})
+
+    def simplify_stream(self, request: dict, options: dict, workers: int):
+        if "texts" in request:
+            texts = get_texts(request, self.server.max_texts)
+            self.send_ndjson(stream_batch(texts, options, workers))
+            return
+        text = get_text(request)
+        if request.get("split"):
+            self.send_ndjson(stream_chunked(text, options, workers))
+        else:
+            self.send_ndjson(stream_text(text, options))
+
+    # ---- Reading and Writing ----
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.MAX_BODY:
+            self.close_connection = True
+            raise ValueError(f"Request body larger than {self.MAX_BODY} bytes.")
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        if not isinstance(request, dict):
+            raise ValueError("The request must be a JSON object.")
+        return request
+
+    def send_body(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status: int, data: dict, headers: dict = None):
+        self.send_body(status, dump_json(data), "application/json", headers)
+
+    def send_ndjson(self, lines: Iterable[dict]):
+        """Send one JSON object per line as each one is ready (chunked transfer encoding)."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for line in lines:
+                data = dump_json(line) + b"\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        finally:
+            # Stops the generation if the client went away
+            if hasattr(lines, "close"):
+                lines.close()
+
+
+def dump_json(data: dict) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# ============== Requests =====================================================
+
+
+def parse_options(request: dict) -> dict:
+    """Return the keyword arguments of the simplification functions from a request."""
+    options = {
+        "llm": request.get("model") or p.MODEL,
+        "use_rules": request.get("use_rules", p.USE_RULES),
+        "top_k": request.get("top_k", p.TOP_K),
+        "top_p": request.get("top_p", p.TOP_P),
+        "temp": request.get("temp", p.TEMP),
+    }
+    types = {
+        "llm": str,
+        "use_rules": bool,
+        "top_k": int,
+        "top_p": (int, float),
+        "temp": (int, float),
+    }
+    for name, expected in types.items():
+        # bool is a subclass of int, so true/false would pass as numbers
+        is_bool = isinstance(options[name], bool) and expected is not bool
+        if is_bool or not isinstance(options[name], expected):
+            raise ValueError(f"Invalid value for '{name}': {options[name]!r}")
+    return options
+
+
+def get_text(request: dict) -> str:
+    text = request.get("text")
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError("'text' must be a non-empty string.")
+    return text
+
+
+def get_texts(request: dict, max_texts: int) -> list[str]:
+    texts = request.get("texts")
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        raise ValueError("'texts' must be a list of strings.")
+    if len(texts) > max_texts:
+        raise ValueError(f"Too many texts ({len(texts)}), at most {max_texts} per request.")
+    return texts
+
+
+def get_fan_out(path: str, request: dict, max_texts: int) -> int:
+    """Return the number of generations a request runs at once."""
+    if path != "/simplify" and "texts" in request:
+        n_generations = len(get_texts(request, max_texts))
+    elif request.get("split"):
+        n_generations = len(split_text(get_text(request), p.CHUNK_MAX_CHARS))
+    else:
+        return 1
+    return max(1, min(p.NUM_PARALLEL, n_generations))
+
+
+def stream_text(text: str, options: dict) -> Iterator[dict]:
+    chunks = simplify_text_stream(text, **options)
+    n_chunks = 0
+    try:
+        for chunk in chunks:
+            n_chunks += 1
+            yield {"text": chunk}
+    finally:
+        chunks.close()
+    if n_chunks:
+        yield {"done": True, "model": options["llm"]}
+    else:
+        yield {"done": True, "error": "The LLM server did not return a response."}
+
+
+def stream_chunked(text: str, options: dict, workers: int) -> Iterator[dict]:
+    simplified_text = simplify_text_chunked(text, **options, workers=workers)
+    if simplified_text is None:
+        yield {"done": True, "error": "The LLM server did not return a response."}
+        return
+    yield {"text": simplified_text}
+    yield {"done": True, "model": options["llm"]}
+
+
+def stream_batch(texts: list[str], options: dict, workers: int) -> Iterator[dict]:
+    results = simplify_batch(texts, **options, workers=workers)
+    failed = 0
+    try:
+        for position, result in results:
+            failed += result is None
+            yield {"index": position, "text": result}
+    finally:
+        results.close()
+    yield {"done": True, "failed": failed, "model": options["llm"]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve the simplification as JSON API, without the GUI."
+    )
+    parser.add_argument("--host", type=str, default=p.SERVER_HOST, help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=p.SERVER_PORT, help="Port to listen on.")
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=p.SERVER_CONCURRENCY,
+        help="Generations run at once, over all requests (0 = unlimited).",
+    )
+
+    args = parser.parse_args()
+
+    discover_models()
+    if p.WARMUP in ("default", "all"):
+        warm_up([p.MODEL], background=False)
+    server = SimplifyServer((args.host, args.port), args.concurrency)
+    logger.info(f"Serving the simplification API on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,48 +1,95 @@
+import os, sys, tempfile
+import numpy as np
 import pandas as pd
-from matplotlib import pyplot as plt
-import textstat
 import argparse
-from leichtesprache.utils import get_new_file_path
-from leichtesprache.parameters import LANGUAGE
-
-textstat.set_lang(LANGUAGE)
+from typing import Iterable, Iterator
+from leichtesprache.utils import (
+    RECORD_FORMATS,
+    TableWriter,
+    batched,
+    get_new_file_path,
+    read_batches,
+    read_records,
+    read_table,
+    write_records,
+    write_table,
+)
+from leichtesprache.dedup import NearDuplicateIndex
+from leichtesprache.parameters import NEAR_DUPLICATE_THRESHOLD
+from leichtesprache.tools.readability import score_texts
 
 
 def calculate_fre_score(text: str) -> float:
-    return max(textstat.flesch_reading_ease(text), 0)
+    return float(score_texts([text])[0][0])
 
 
 def calculate_wstf_score(text: str) -> float:
-    return max(textstat.wiener_sachtextformel(text, 1), 4)
-
+    return float(score_texts([text])[1][0])
 
-def preprocess_data(
-    file_path: str, save_file: bool = False, verbose: bool = False
-) -> pd.DataFrame:
-    """Clean the data from a CSV file"""
 
-    df = pd.read_csv(file_path, usecols=[0, 1])
-    if verbose:
-        print("Initial Dataset Info:")
-        df.info(verbose=False)
-        print()
-        print(df.describe().to_markdown())
+def preprocess_batches(
+    batches: Iterable[pd.DataFrame], verbose: bool = False, near_duplicates: float | None = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Clean batches of data: drop empty values and duplicates, and rename the columns.
 
-        # Check for empty values and duplicates
-        empty_values = df[df.isna().any(axis=1)]
-        duplicated_values = df[df.duplicated()]
-        if len(empty_values) > 0:
-            print("-" * 80)
-            print("Empty Values:\n", empty_values)
-        if len(duplicated_values) > 0:
-            print("\nDuplicated Values:\n", duplicated_values)
+    Duplicates are detected across batches with a set of row hashes, so the whole dataset
+    never has to be in memory. With `near_duplicates` (a similarity threshold, see
+    dedup.NearDuplicateIndex), rows whose original text is nearly the same as the one of an
+    earlier row are dropped as well.
+    """
+    seen = set()
+    index = NearDuplicateIndex(near_duplicates) if near_duplicates else None
+    for df in batches:
+        if verbose:
+            empty_values = df[df.isna().any(axis=1)]
+            if len(empty_values) > 0:
+                print("-" * 80)
+                print("Empty Values:\n", empty_values)
+
+        df = df.dropna()
+
+        # Rename Column Names
+        headers = df.columns.to_list()
+        df = df.rename(columns={headers[0]: 'Original', headers[1]: 'Leichte Sprache'})
+
+        hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+        keep = np.zeros(len(hashes), dtype=bool)
+        for i, row_hash in enumerate(hashes):
+            if row_hash not in seen:
+                seen.add(row_hash)
+                keep[i] = True
+        if verbose and not keep.all():
+            print("\nDuplicated Values:\n", df[~keep])
+        df = df[keep]
+
+        if index:
+            start = index.size
+            clusters = index.add(df['Original'].to_list())
+            first = clusters == np.arange(start, start + len(df))
+            if verbose and not first.all():
+                print("\nNear Duplicates:\n", df[~first])
+            df = df[first]
+
+        yield df.copy()
 
-    df.dropna(inplace=True, ignore_index=True)
 
-    # Rename Column Names
-    headers = df.columns.to_list()
-    df.rename(columns={headers[0]: 'Original', headers[1]: 'Leichte Sprache'}, inplace=True)
-    df.drop_duplicates(inplace=True, ignore_index=True)
+def preprocess_data(
+    file_path: str,
+    save_file: bool = False,
+    verbose: bool = False,
+    batch_size: int = 10_000,
+    near_duplicates: float | None = None,
+) -> pd.DataFrame:
+    """Clean the data from a CSV, Parquet or Arrow file"""
+
+    batches = read_batches(file_path, batch_size, columns=[0, 1])
+    cleaned = preprocess_batches(batches, verbose=verbose, near_duplicates=near_duplicates)
+    # An empty file (or one with only a header) has no batches
+    df = pd.concat(
+        list(cleaned) or [pd.DataFrame(columns=["Original", "Leichte Sprache"])],
+        ignore_index=True,
+    )
 
     if verbose:
         print("\n" + "-" * 80)
@@ -52,41 +99,43 @@ def preprocess_data(
         print(df.describe().to_markdown())
 
     if save_file:
-        output_file = get_new_file_path(suffix="_preprocessed")
-        df.to_csv(output_file, index=False, encoding='utf-8')
+        output_file = get_new_file_path(file_path, suffix="_preprocessed")
+        write_table(df, output_file)
         print(f"Preprocessed data saved to {output_file}")
 
     return df
 
 
 def calculate_complexity_scores(
-    df: pd.DataFrame, verbose: bool = True, tophard: bool = False
+    df: pd.DataFrame, verbose: bool = True, tophard: bool = False, workers: int = 1
 ) -> pd.DataFrame:
     """
     Calculate Flesch Reading Ease (FRE) score and Wiener Sachtextformel (WSTF) score for a given DataFrame.
 
     Args:
         df: The DataFrame containing the text to be analyzed.
-        language (str, optional): The language of the text (Defaults to 'de' for German)
+        workers (int, optional): Number of processes used for scoring. Defaults to 1.
 
     Returns:
         A DataFrame with the Original and Leichte Sprache texts along with their respective scores.
     """
 
-    # Calculate Flesch Reading Ease scores
-    df['Original FRE Score'] = df['Original'].apply(calculate_fre_score)
-    df['Leichte Sprache FRE Score'] = df['Leichte Sprache'].apply(calculate_fre_score)
-
-    # Calculate Wiener Sachtextformel scores
-    df['Original WSTF Score'] = df['Original'].apply(calculate_wstf_score)
-    df['Leichte Sprache WSTF Score'] = df['Leichte Sprache'].apply(calculate_wstf_score)
+    # Calculate Flesch Reading Ease and Wiener Sachtextformel scores, tokenizing each text once.
+    # Both columns are scored in one go so that a single process pool is used
+    texts = df['Original'].to_list() + df['Leichte Sprache'].to_list()
+    fre_scores, wstf_scores = score_texts(texts, workers=workers)
+    n = df.shape[0]
+    df['Original FRE Score'] = fre_scores[:n]
+    df['Leichte Sprache FRE Score'] = fre_scores[n:]
+    df['Original WSTF Score'] = wstf_scores[:n]
+    df['Leichte Sprache WSTF Score'] = wstf_scores[n:]
 
     if verbose:
         # Calculate averages
-        average_original = df['Original FRE Score'].mean().round(2)
-        average_leichte_sprache = df['Leichte Sprache FRE Score'].mean().round(2)
-        average_original_wstf = df['Original WSTF Score'].mean().round(2)
-        average_leichte_sprache_wstf = df['Leichte Sprache WSTF Score'].mean().round(2)
+        average_original = round(df['Original FRE Score'].mean(), 2)
+        average_leichte_sprache = round(df['Leichte Sprache FRE Score'].mean(), 2)
+        average_original_wstf = round(df['Original WSTF Score'].mean(), 2)
+        average_leichte_sprache_wstf = round(df['Leichte Sprache WSTF Score'].mean(), 2)
 
         # Print scores and averages
         print("\n" + "=" * 80)
@@ -146,6 +195,8 @@ def plot_scores(
     Returns:
         None
     """
+    # Imported here, as matplotlib takes long to import and is only needed for the graphs
+    from matplotlib import pyplot as plt
 
     COLORS = [
         "black",
@@ -165,7 +216,7 @@ def plot_scores(
         raise ValueError("No score headers found for the specified score name.")
 
     # Average scores for plotting
-    averages = [df[header].mean().round(2) for header in score_headers]
+    averages = [round(df[header].mean(), 2) for header in score_headers]
 
     df.plot.bar(x=None, y=score_headers, color=colors, figsize=(10, 7), legend=True)
 
@@ -198,26 +249,146 @@ def plot_scores(
         plt.show()
 
 
-def main(
-    file_path: str, save_file: bool = True, plot: bool = True, verbose: bool = True
+def analyse_in_batches(
+    file_path: str,
+    output_file: str,
+    batch_size: int,
+    workers: int = 1,
+    near_duplicates: float | None = None,
 ) -> pd.DataFrame:
+    """
+    Preprocess and score a dataset batch by batch, appending the results to the output file.
 
-    df = preprocess_data(file_path, save_file=False, verbose=verbose)
+    Memory use does not depend on the size of the dataset (apart from the row hashes used to
+    drop duplicates and the near-duplicate index).
 
-    df = calculate_complexity_scores(df, tophard=True)
+    Returns:
+        pd.DataFrame: The average of the scores.
+    """
+    sums, counts = 0, 0
+    batches = read_batches(file_path, batch_size, columns=[0, 1])
+    with TableWriter(output_file) as writer:
+        for df in preprocess_batches(batches, near_duplicates=near_duplicates):
+            df = calculate_complexity_scores(df, verbose=False, workers=workers)
+            writer.write(df)
+            scores = df.filter(like="Score")
+            sums, counts = sums + scores.sum(), counts + scores.count()
+            print(f"Analysed {writer.rows} rows", end="\r")
+
+    print()
+    return (sums / counts).round(2).to_frame("Average")
+
+
+def analyse_records(
+    records: Iterable[dict],
+    columns: tuple[str, ...] = ("Original", "Leichte Sprache"),
+    batch_size: int = 1000,
+    workers: int = 1,
+) -> Iterator[dict]:
+    """
+    Score the text columns of a stream of records, yielding the records in batches as they are
+    scored.
 
-    if verbose:
-        print("\n" + "=" * 80)
-        print("\nAnalysed Data Stats:\n")
-        print(df.describe().to_markdown())
+    Adds a "<column> FRE Score" and "<column> WSTF Score" field for each column (empty if the
+    text is missing). Unlike preprocess_data, empty values and duplicates are kept, so memory
+    use only depends on `batch_size`.
+    """
+    for batch in batched(records, batch_size):
+        texts = [record.get(column) for column in columns for record in batch]
+        missing = [not isinstance(text, str) or not text for text in texts]
+        texts = ["" if empty else text for text, empty in zip(texts, missing)]
+        fre_scores, wstf_scores = score_texts(texts, workers=workers)
+        for n, column in enumerate(columns):
+            for i, record in enumerate(batch):
+                position = n * len(batch) + i
+                empty = missing[position]
+                record[f"{column} FRE Score"] = None if empty else float(fre_scores[position])
+                record[f"{column} WSTF Score"] = None if empty else float(wstf_scores[position])
+        yield from batch
 
-    output_filename = None
-    if save_file:
-        output_filename = get_new_file_path(file_path, suffix="_analysed")
-        df.to_csv(output_filename, index=False, encoding="utf-8")
-        print(f"\nSaved analysed dataset to {output_filename}")
 
-    if plot:
+def main(
+    file_path: str,
+    save_file: bool = True,
+    plot: bool = True,
+    verbose: bool = True,
+    workers: int = 1,
+    batch_size: int | None = None,
+    output_format: str | None = None,
+    stream_format: str = "jsonl",
+    columns: list[str] = ("Original", "Leichte Sprache"),
+    near_duplicates: float | None = None,
+) -> pd.DataFrame | None:
+    """
+    Analyse the text complexity of a dataset.
+
+    The dataset can be a CSV, Parquet or Arrow (Feather) file. The analysed dataset is saved in
+    the same format, unless another `output_format` (file extension) is given.
+
+    If `batch_size` is given, the dataset is streamed through preprocessing and scoring in
+    batches of rows and written to the output file as it goes, instead of being loaded at once.
+    The plots are then made from the score columns of the output file, which is a temporary
+    file without `save_file`.
+
+    With `near_duplicates` (a similarity threshold), rows nearly the same as an earlier row
+    are dropped with the duplicates.
+
+    With `file_path` "-", records are read from stdin and written to stdout with the scores of
+    their text `columns` (JSON lines or CSV, see `stream_format`, in batches of `batch_size`
+    records), without files or plots.
+    """
+    if file_path == "-":
+        records = read_records(sys.stdin, stream_format)
+        write_records(
+            analyse_records(records, tuple(columns), batch_size or 1000, workers),
+            sys.stdout,
+            stream_format,
+        )
+        return None
+
+    extension = f".{output_format}" if output_format else None
+    if batch_size:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            if save_file:
+                output_filename = get_new_file_path(
+                    file_path, suffix="_analysed", extension=extension
+                )
+            else:
+                output_filename = os.path.join(
+                    temp_dir, "analysed" + (extension or os.path.splitext(file_path)[1])
+                )
+            averages = analyse_in_batches(
+                file_path, output_filename, batch_size, workers, near_duplicates
+            )
+            if verbose:
+                print("\n" + "=" * 80)
+                print("\nAnalysed Data Stats:\n")
+                print(averages.to_markdown())
+            df = read_table(output_filename, columns=lambda column: "Score" in column)
+        if save_file:
+            print(f"\nSaved analysed dataset to {output_filename}")
+        else:
+            output_filename = None
+
+    else:
+        df = preprocess_data(
+            file_path, save_file=False, verbose=verbose, near_duplicates=near_duplicates
+        )
+
+        df = calculate_complexity_scores(df, tophard=True, workers=workers)
+
+        if verbose:
+            print("\n" + "=" * 80)
+            print("\nAnalysed Data Stats:\n")
+            print(df.describe().to_markdown())
+
+        output_filename = None
+        if save_file:
+            output_filename = get_new_file_path(file_path, suffix="_analysed", extension=extension)
+            write_table(df, output_filename)
+            print(f"\nSaved analysed dataset to {output_filename}")
+
+    if plot and not df.empty:
         show_graph = True if df.shape[0] < 100 else False
         plot_scores(
             df, score_name="FRE", save_file=True, orig_file=output_filename, show_graph=show_graph
@@ -233,7 +404,55 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Analyze text complexity using Flesch Reading Ease and Wiener Sachtextformel scores."
     )
-    parser.add_argument("file", type=str, help="Path to the input CSV file")
+    parser.add_argument(
+        "file", type=str, help="Path to the input CSV, Parquet or Arrow file, or - for stdin"
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=1, help="Number of processes used for scoring."
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=None,
+        help="Stream the dataset in batches of this many rows instead of loading it at once.",
+    )
+    parser.add_argument(
+        "-f",
+        "--output-format",
+        choices=["csv", "parquet", "feather"],
+        default=None,
+        help="Format of the analysed dataset. Defaults to the format of the input file.",
+    )
+    parser.add_argument(
+        "--stream-format",
+        choices=RECORD_FORMATS,
+        default="jsonl",
+        help="Format of the records on stdin and stdout (with file -).",
+    )
+    parser.add_argument(
+        "--columns",
+        nargs="+",
+        default=["Original", "Leichte Sprache"],
+        help="Text columns of the records to score (with file -).",
+    )
+    parser.add_argument(
+        "--near-duplicates",
+        type=float,
+        nargs="?",
+        const=NEAR_DUPLICATE_THRESHOLD,
+        default=None,
+        metavar="THRESHOLD",
+        help="Also drop near duplicates, with a minimum similarity (0-1) as threshold.",
+    )
     args = parser.parse_args()
 
-    main(args.file)
+    main(
+        args.file,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        output_format=args.output_format,
+        stream_format=args.stream_format,
+        columns=args.columns,
+        near_duplicates=args.near_duplicates,
+    )
@@ -0,0 +1,214 @@
+import logging, os
+import argparse
+import time
+import pandas as pd
+from leichtesprache.cache import configure_cache
+from leichtesprache.llm import unload_model
+from leichtesprache.tools.process_dataset import load_dataset, process_df_w_llm
+from leichtesprache.tools.readability import score_texts
+from leichtesprache.utils import get_new_file_path, write_table
+import leichtesprache.parameters as p
+
+logging.basicConfig(format=os.getenv("LOG_FORMAT", "%(asctime)s [%(levelname)s] %(message)s"))
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
+
+RULES_CHOICES = {"both": [False, True], "off": [False], "on": [True]}
+
+# %% ============== Compare Models ==========================================
+
+
+def score_source(df: pd.DataFrame, column: str, workers: int = 1) -> pd.DataFrame:
+    """Add the FRE and WSTF scores of the source column, unless the dataset already has them."""
+    fre_header, wstf_header = f"{column} FRE Score", f"{column} WSTF Score"
+    if fre_header not in df.columns or wstf_header not in df.columns:
+        logger.info(f"Calculating readability scores of column '{column}'...")
+        df[fre_header], df[wstf_header] = score_texts(df[column].to_list(), workers=workers)
+    return df
+
+
+def compare_models(
+    df: pd.DataFrame,
+    models: list[str],
+    rules: list[bool],
+    column: str = "Original",
+    unload: bool = True,
+    **kwargs,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Process a dataset with several models, with and without rules, into one wide table.
+
+    All requests for a model are sent before moving on to the next model, so the LLM server
+    loads each model only once. With `unload`, a model is unloaded as soon as it is done,
+    instead of occupying memory until its keep_alive expires while the next one is loaded.
+
+    Keyword arguments are passed on to process_df_w_llm.
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: The dataset with the response and score columns
+        of every run, and a summary with the average scores and the duration of each run.
+    """
+    summary = []
+    for model in models:
+        for use_rules in rules:
+            header = model + ("_w_rules" if use_rules else "")
+            start = time.perf_counter()
+            df = process_df_w_llm(df, model, use_rules, column_choice=column, **kwargs)
+            duration = time.perf_counter() - start
+            summary.append(
+                {
+                    "Model": model,
+                    "Rules": use_rules,
+                    "FRE Score": df[f"{header} FRE Score"].mean(),
+                    "WSTF Score": df[f"{header} WSTF Score"].mean(),
+                    "Failed": int(df[f"{header} FRE Score"].isna().sum()),
+                    "Duration (s)": duration,
+                    "Rows/s": df.shape[0] / duration if duration else 0.0,
+                }
+            )
+        if unload:
+            unload_model(model)
+
+    return df, pd.DataFrame(summary).round(2)
+
+
+def main(
+    file_path: str,
+    models: list[str],
+    rules: str = "both",
+    column: str = "Original",
+    save_file: bool = True,
+    concurrency: int = p.NUM_PARALLEL,
+    resume: bool = False,
+    workers: int = 1,
+    unload: bool = True,
+    output_format: str | None = None,
+):
+    """
+    Compare several models on a dataset.
+
+    The dataset is loaded and its source column scored once. The wide result table is saved
+    next to the input file (*_compared), and the summary of all runs is printed. Finished rows
+    of all runs share one checkpoint file, so an interrupted comparison can be resumed.
+    """
+    df = load_dataset(file_path, verbose=False)
+    if column not in df.columns:
+        raise ValueError(f"Column '{column}' does not exist in the dataset.")
+    df = score_source(df, column, workers=workers)
+
+    extension = f".{output_format}" if output_format else None
+    output_file = get_new_file_path(file_path, suffix="_compared", extension=extension)
+    checkpoint_file = get_new_file_path(output_file, suffix="_checkpoint", extension=".jsonl")
+    logger.info(f"Comparing {len(models)} models on {df.shape[0]} rows")
+    logger.info(f"Saving finished rows to checkpoint {checkpoint_file}")
+
+    df, summary = compare_models(
+        df,
+        models,
+        RULES_CHOICES[rules],
+        column,
+        unload=unload,
+        verbose=False,
+        concurrency=concurrency,
+        checkpoint_file=checkpoint_file,
+        resume=resume,
+        workers=workers,
+    )
+
+    print(f"\nSource column '{column}':")
+    averages = df[[f"{column} FRE Score", f"{column} WSTF Score"]].mean().round(2)
+    print(averages.to_frame("Average").to_markdown())
+    print()
+    print(summary.to_markdown(index=False))
+
+    if save_file:
+        write_table(df, output_file)
+        logger.info(f"Saved comparison to {output_file}")
+
+    return df, summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare several models on a dataset.")
+    parser.add_argument(
+        "file_path", type=str, help="Path to the input CSV, Parquet or Arrow file."
+    )
+    parser.add_argument(
+        "-m",
+        "--models",
+        type=str,
+        nargs="+",
+        default=p.LLM_CHOICES,
+        help="Models to compare. Defaults to all models in LLM_CHOICES.",
+    )
+
+    parser.add_argument(
+        "-r",
+        "--rules",
+        choices=list(RULES_CHOICES),
+        default="both",
+        help="Process with rules, without rules or both.",
+    )
+
+    parser.add_argument(
+        "-c",
+        "--column",
+        type=str,
+        default="Original",
+        help="Name of the column containing the text to process.",
+    )
+
+    parser.add_argument(
+        "-p",
+        "--parallel",
+        type=int,
+        default=p.NUM_PARALLEL,
+        help="Number of concurrent requests to the LLM server (see OLLAMA_NUM_PARALLEL).",
+    )
+
+    parser.add_argument(
+        "--cache",
+        type=str,
+        default=p.CACHE_PATH,
+        help="Path to the LLM response cache. Defaults to LS_CACHE_PATH (empty = no cache).",
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip rows already processed with the same settings in a previous run.",
+    )
+
+    parser.add_argument(
+        "-w", "--workers", type=int, default=1, help="Number of processes used for scoring."
+    )
+
+    parser.add_argument(
+        "--keep-loaded",
+        action="store_true",
+        help="Do not unload a model from the LLM server after its runs.",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--output-format",
+        choices=["csv", "parquet", "feather"],
+        default=None,
+        help="Format of the result table. Defaults to the format of the input file.",
+    )
+
+    args = parser.parse_args()
+
+    configure_cache(args.cache)
+
+    main(
+        args.file_path,
+        args.models,
+        args.rules,
+        args.column,
+        concurrency=args.parallel,
+        resume=args.resume,
+        workers=args.workers,
+        unload=not args.keep_loaded,
+        output_format=args.output_format,
+    )
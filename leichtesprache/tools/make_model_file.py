@@ -1,21 +1,28 @@
 import logging, os
-import pandas as pd
 import argparse
+from itertools import chain
 from leichtesprache.prompts import SYSTEM_MESSAGE_LS, PROMPT_TEMPLATE
+from leichtesprache.utils import read_batches
 
 logging.basicConfig(format=os.getenv("LOG_FORMAT", "%(asctime)s [%(levelname)s] %(message)s"))
 logger = logging.getLogger(__name__)
 logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
 
 
-def main(file_path: str, output_file: str = "ModelfileLS_FS", base_model: str = "llama3.1"):
+def main(
+    file_path: str,
+    output_file: str = "ModelfileLS_FS",
+    base_model: str = "llama3.1",
+    batch_size: int = 10_000,
+):
     """
-    Converts a CSV file containing columns 'Original' and 'Leichte Sprache' to a text file with specific formatting for model usage.
+    Converts a CSV, Parquet or Arrow file containing columns 'Original' and 'Leichte Sprache' to a text file with specific formatting for model usage.
 
     Args:
-        file_path (str): Path to the input CSV file.
+        file_path (str): Path to the input CSV, Parquet or Arrow file.
         output_file (str, optional): Name of the output text file. Defaults to "ModelfileLS_FS".
         base_model (str, optional): Base model name for the specific format requirements. Defaults to "llama3.1".
+        batch_size (int, optional): Number of rows read from the input file at once. Defaults to 10000.
 
     Raises:
         FileNotFoundError: If the specified file path does not exist.
@@ -41,29 +48,29 @@ def main(file_path: str, output_file: str = "ModelfileLS_FS", base_model: str =
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found at {file_path}")
 
-    # Read the input CSV file into a DataFrame
-    df = pd.read_csv(file_path)
+    # Read the input file in batches, so that its size is not limited by memory
+    batches = read_batches(file_path, batch_size)
+    df = next(batches, None)
 
     # Check if the required columns are present
-    if 'Original' not in df.columns or 'Leichte Sprache' not in df.columns:
-        logger.error(
-            "The input CSV file must contain the columns 'Original' and 'Leichte Sprache'."
-        )
+    if df is None or 'Original' not in df.columns or 'Leichte Sprache' not in df.columns:
+        logger.error("The input file must contain the columns 'Original' and 'Leichte Sprache'.")
         parser.print_help()
         return
 
     # Write the rows of the specified columns to a text file
     with open(output_file, 'w') as f:
         f.write(f"{BASE_FILE_TXT}")
-        for index, row in df[['Original', 'Leichte Sprache']].iterrows():
-            f.write("MESSAGE user \"\"\"")
-            # f.write(f"{PROMPT_TEMPLATE.format(text='')}")
-            f.write(PROMPT_TEMPLATE.format(text=""))
-            f.write(f"{row['Original']}\n")
-            f.write("\"\"\"\n")
-            f.write("MESSAGE assistant \"\"\"\n")
-            f.write(f"{row['Leichte Sprache']}\n")
-            f.write("\"\"\"\n")
+        for df in chain([df], batches):
+            for index, row in df[['Original', 'Leichte Sprache']].iterrows():
+                f.write("MESSAGE user \"\"\"")
+                # f.write(f"{PROMPT_TEMPLATE.format(text='')}")
+                f.write(PROMPT_TEMPLATE.format(text=""))
+                f.write(f"{row['Original']}\n")
+                f.write("\"\"\"\n")
+                f.write("MESSAGE assistant \"\"\"\n")
+                f.write(f"{row['Leichte Sprache']}\n")
+                f.write("\"\"\"\n")
 
     logger.info(f"Data has been written to {output_file}")
 
@@ -77,6 +84,7 @@ if __name__ == "__main__":
         default="ModelfileLS_FS",
     )
     parser.add_argument("--base_model", type=str, default="llama3.1")
+    parser.add_argument("--batch_size", type=int, default=10_000)
     args = parser.parse_args()
 
-    main(args.input_file, args.output_file, args.base_model)
+    main(args.input_file, args.output_file, args.base_model, args.batch_size)
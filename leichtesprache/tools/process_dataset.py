@@ -1,10 +1,31 @@
 import logging, os
 import argparse
+import hashlib, json, sys
+from contextlib import nullcontext
+from typing import Iterable, Iterator
 import pandas as pd
 from tqdm import tqdm
-from leichtesprache.core import simplify_text
-from leichtesprache.tools.analysedata import calculate_fre_score, calculate_wstf_score, plot_scores
-from leichtesprache.utils import get_new_file_path
+from leichtesprache.core import simplify_batch, simplify_text, simplify_text_batch
+from leichtesprache.llm import supports_batch
+from leichtesprache.cache import configure_cache, get_cache
+from leichtesprache.dedup import find_near_duplicates
+from leichtesprache.prompts import PROMPT_TEMPLATE, RULES_LS
+from leichtesprache.tools.analysedata import plot_scores
+from leichtesprache.tools.readability import score_texts
+from leichtesprache.utils import (
+    RECORD_FORMATS,
+    TableWriter,
+    batched,
+    bounded_map,
+    call_with_retry,
+    get_new_file_path,
+    get_table_columns,
+    read_batches,
+    read_records,
+    read_table,
+    write_records,
+    write_table,
+)
 import leichtesprache.parameters as p
 
 logging.basicConfig(format=os.getenv("LOG_FORMAT", "%(asctime)s [%(levelname)s] %(message)s"))
@@ -22,7 +43,7 @@ def load_dataset(file_path: str, verbose=True) -> pd.DataFrame:
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found at {file_path}")
 
-    df = pd.read_csv(file_path)
+    df = read_table(file_path)
 
     if verbose:
         print("Initial Dataset Info:")
@@ -32,77 +53,349 @@ def load_dataset(file_path: str, verbose=True) -> pd.DataFrame:
 
         # Average FRE score
         if "Original FRE Score" in df.columns:
-            avg_original = df["Original FRE Score"].mean().round(2)
+            avg_original = round(df["Original FRE Score"].mean(), 2)
             print("-" * 80)
             print("Flesch Reading Ease Score (low = hard, high = easy):")
             print("Average Original FRE Score:", avg_original)
         if "Leichte Sprache FRE Score" in df.columns:
-            avg_leichte_sprache = df["Leichte Sprache FRE Score"].mean().round(2)
+            avg_leichte_sprache = round(df["Leichte Sprache FRE Score"].mean(), 2)
             print("Average Leichte Sprache FRE Score:", avg_leichte_sprache)
 
         # Average Wiener score
         if "Original WSTF Score" in df.columns:
-            avg_original_wstf = df["Original WSTF Score"].mean().round(2)
+            avg_original_wstf = round(df["Original WSTF Score"].mean(), 2)
             print("-" * 80)
             print("Wiener Sachtextformel: (min: 4 = easy, max: ~15 = hard)")
             print("Average Original WSTF Score:", round(avg_original_wstf, 2))
         if "Leichte Sprache WSTF Score" in df.columns:
-            avg_leichte_sprache_wstf = df["Leichte Sprache WSTF Score"].mean().round(2)
+            avg_leichte_sprache_wstf = round(df["Leichte Sprache WSTF Score"].mean(), 2)
             print("Average Leichte Sprache WSTF Score:", round(avg_leichte_sprache_wstf, 2))
             print("-" * 80)
 
     return df
 
 
+# %% ============== Checkpoints =============================================
+
+
+def get_run_key(model: str, use_rules: bool, column: str) -> str:
+    """Identify a processing run by the settings that determine its results."""
+    settings = [model, use_rules, column, p.TOP_K, p.TOP_P, p.TEMP, PROMPT_TEMPLATE, RULES_LS]
+    if p.PROMPT_LAYOUT != "text-first":
+        settings.append(p.PROMPT_LAYOUT)
+    return hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()[:16]
+
+
+def get_text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def load_checkpoint(checkpoint_file: str, run_key: str, rows: set | None = None) -> dict:
+    """
+    Load the finished rows of a run from a checkpoint file.
+
+    The checkpoint is a JSONL file with one record per finished row. Records of other runs
+    (different model, rules or parameters) are ignored, as are rows not in `rows` if given.
+
+    Returns:
+        dict: The records of the run, by row number.
+    """
+    records = {}
+    if not os.path.exists(checkpoint_file):
+        return records
+    with open(checkpoint_file, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line may be incomplete if the run was killed while writing it
+                continue
+            if record.get("run") == run_key and (rows is None or record["row"] in rows):
+                records[record["row"]] = record
+    return records
+
+
 # %% ============== Process Dataset with LLM ===================================
 
 
+def simplify_row(text: str, model: str, use_rules: bool, retries: int = p.MAX_RETRIES) -> str:
+    """Simplify a text, retrying with exponential backoff if it fails."""
+    return call_with_retry(
+        simplify_text,
+        text,
+        model,
+        use_rules=use_rules,
+        top_k=p.TOP_K,
+        top_p=p.TOP_P,
+        temp=p.TEMP,
+        retries=retries,
+        backoff=p.RETRY_BACKOFF,
+    )
+
+
 def process_df_w_llm(
     df: pd.DataFrame,
     model: str = p.MODEL,
     use_rules: bool = False,
     column_choice: str = "Original",
     verbose: bool = True,
+    concurrency: int = p.NUM_PARALLEL,
+    retries: int = p.MAX_RETRIES,
+    checkpoint_file: str | None = None,
+    resume: bool = False,
+    workers: int = 1,
+    prompts_per_request: int = p.PROMPTS_PER_REQUEST,
+    near_duplicates: float | None = None,
+    done: dict | None = None,
 ) -> pd.DataFrame:
-    """Process the dataset with LLM and calculate readability scores."""
+    """
+    Process the dataset with LLM and calculate readability scores.
+
+    Rows are sent to the LLM concurrently with at most `concurrency` requests in flight. Failed
+    requests are retried with exponential backoff. Results are written back in row order.
+    If the LLM API supports it, `prompts_per_request` rows are sent with each request (see
+    core.simplify_batch) and only the failed ones are retried one by one.
+
+    If a checkpoint file is given, every finished row is appended to it right away. Without
+    `resume`, the checkpoint is started anew. With `resume`, rows already in the checkpoint for
+    the same model, rules and parameters are not processed again. The readability scores are calculated with `workers` processes.
+    Instead of reading the checkpoint, the records of finished rows can be passed as `done`
+    (see load_checkpoint). The records of the rows in `df` are removed from it.
 
-    logger.info(f"Processing dataset with LLM {model}...")
+    With `near_duplicates` (a similarity threshold, see dedup.NearDuplicateIndex), only the
+    first row of each group of near-identical texts is sent to the LLM, and the other rows
+    get its response. The row it was taken from is noted in the "Near Duplicate Of" column.
+    """
+
+    logger.info(f"Processing dataset with LLM {model} ({concurrency} parallel requests)...")
 
     HEADER = model
     if use_rules:
         HEADER += "_w_rules"
 
-    for index, row in tqdm(df.iterrows(), total=df.shape[0]):
-        if pd.isna(row[column_choice]):
+    def process_row(text: str) -> str:
+        return simplify_row(text, model, use_rules, retries)
+
+    run_key = get_run_key(model, use_rules, column_choice)
+    if done is None:
+        done = {}
+        if checkpoint_file and resume:
+            done = load_checkpoint(checkpoint_file, run_key, rows=set(df.index))
+
+    # Rows are identified by their index label, which continues across batches of a file
+    results, rows = {}, []
+    for row, text in df[column_choice].items():
+        if pd.isna(text):
             continue
-        response = simplify_text(
-            row[column_choice],
+        record = done.pop(row, None)
+        if record and record["text"] == get_text_hash(text):
+            results[row] = record["response"]
+        else:
+            rows.append((row, text))
+    if results:
+        logger.info(f"Resuming: {len(results)} rows already processed")
+
+    reused = {}
+    if near_duplicates:
+        texts = df[column_choice].dropna()
+        clusters = find_near_duplicates(texts.to_list(), near_duplicates)
+        for row, first_row in zip(texts.index, texts.index[clusters]):
+            if row != first_row:
+                reused[row] = first_row
+        rows = [(row, text) for row, text in rows if row not in reused]
+        logger.info(f"{len(reused)} near-duplicate rows reuse the response of a similar row")
+
+    def process_rows(texts: list[str]):
+        if prompts_per_request <= 1 or not supports_batch():
+            yield from bounded_map(process_row, texts, workers=concurrency)
+            return
+        batches = simplify_batch(
+            texts,
             model,
-            use_rules=use_rules,
+            use_rules,
             top_k=p.TOP_K,
             top_p=p.TOP_P,
             temp=p.TEMP,
+            batch_size=prompts_per_request,
+            workers=concurrency,
         )
-        fre_score = calculate_fre_score(response)
-        wstf_score = calculate_wstf_score(response)
-
-        df.loc[index, f"Leichte Sprache {HEADER}"] = response
-        df.loc[index, f"{HEADER} FRE Score"] = fre_score
-        df.loc[index, f"{HEADER} WSTF Score"] = wstf_score
+        for position, result in batches:
+            if result is None:
+                try:
+                    result = process_row(texts[position])
+                except Exception as e:
+                    result = e
+            yield position, result
+
+    mode = "a" if resume else "w"
+    with open(checkpoint_file, mode, encoding="utf-8") if checkpoint_file else nullcontext() as f:
+        for position, result in tqdm(process_rows([text for _, text in rows]), total=len(rows)):
+            row, text = rows[position]
+            if isinstance(result, Exception):
+                logger.error(f"Row {row} failed: {result}")
+                continue
+            results[row] = result
+            if f:
+                record = {
+                    "run": run_key,
+                    "row": row,
+                    "text": get_text_hash(text),
+                    "response": result,
+                }
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+
+    for row, first_row in reused.items():
+        if row not in results and first_row in results:
+            results[row] = results[first_row]
+
+    # Scoring is CPU-bound and runs after generation, split across `workers` processes.
+    # Assignment aligns on the index, so the results end up in row order
+    responses = pd.Series(results, dtype=object)
+    fre_scores, wstf_scores = score_texts(responses.to_list(), workers=workers)
+    df[f"Leichte Sprache {HEADER}"] = responses
+    # Float columns even if no row got a response (empty dataset, LLM server down)
+    df[f"{HEADER} FRE Score"] = pd.Series(fre_scores, index=responses.index, dtype=float)
+    df[f"{HEADER} WSTF Score"] = pd.Series(wstf_scores, index=responses.index, dtype=float)
+    if near_duplicates:
+        df[f"{HEADER} Near Duplicate Of"] = pd.Series(reused, index=df.index, dtype=object)
 
     if verbose:
+        cache = get_cache()
+        if cache:
+            print(f"\nResponse cache: {cache.stats()}")
+
         # Average FRE score
         print(f"\n{HEADER} Average Scores:")
-        avg_fre = df[f"{HEADER} FRE Score"].mean().round(2)
+        avg_fre = round(df[f"{HEADER} FRE Score"].mean(), 2)
         print("Average Flesch Reading Ease Score:", avg_fre)
 
         # Average WSTF score
-        avg_wstf = df[f"{HEADER} WSTF Score"].mean().round(2)
+        avg_wstf = round(df[f"{HEADER} WSTF Score"].mean(), 2)
         print("Average Wiener Sachtextformel Score:", avg_wstf)
 
     return df
 
 
+def read_batches_or_empty(file_path: str, batch_size: int) -> Iterator[pd.DataFrame]:
+    """
+    Read a dataset in batches. A dataset without rows (e.g. only a header) is read as one empty
+    batch with its columns, so that an empty output file is written for it.
+    """
+    empty = True
+    for df in read_batches(file_path, batch_size):
+        empty = False
+        yield df
+    if empty:
+        yield pd.DataFrame(columns=get_table_columns(file_path))
+
+
+def process_in_batches(
+    file_path: str,
+    output_file: str | None,
+    batch_size: int,
+    model: str,
+    use_rules: bool = False,
+    column: str = "Original",
+    **kwargs,
+) -> pd.DataFrame | None:
+    """
+    Process a dataset with the LLM batch by batch, appending the results to the output file.
+
+    Keyword arguments are passed on to process_df_w_llm. The checkpoint is started anew (or,
+    when resuming, read) once for all batches.
+
+    Returns:
+        pd.DataFrame | None: The average of the new score columns, None if the file is empty.
+    """
+    sums, counts, rows = 0, 0, 0
+    header = model + ("_w_rules" if use_rules else "")
+    if kwargs.get("checkpoint_file"):
+        if kwargs.get("resume"):
+            run_key = get_run_key(model, use_rules, column)
+            kwargs["done"] = load_checkpoint(kwargs["checkpoint_file"], run_key)
+        else:
+            # A new run starts a new checkpoint, to which all batches append
+            open(kwargs["checkpoint_file"], "w").close()
+            kwargs["done"] = {}
+        kwargs["resume"] = True
+    with TableWriter(output_file) if output_file else nullcontext() as writer:
+        for df in read_batches_or_empty(file_path, batch_size):
+            if rows == 0 and column not in df.columns:
+                raise ValueError(f"Column '{column}' does not exist in the dataset.")
+
+            df = process_df_w_llm(
+                df, model, use_rules, column_choice=column, verbose=False, **kwargs
+            )
+            if writer:
+                writer.write(df)
+
+            scores = df[[f"{header} FRE Score", f"{header} WSTF Score"]]
+            sums, counts = sums + scores.sum(), counts + scores.count()
+            rows += df.shape[0]
+            logger.info(f"Processed {rows} rows")
+
+    return (sums / counts).round(2).to_frame("Average") if rows else None
+
+
+def process_records(
+    records: Iterable[dict],
+    model: str = p.MODEL,
+    use_rules: bool = False,
+    column: str = "Original",
+    concurrency: int = p.NUM_PARALLEL,
+    retries: int = p.MAX_RETRIES,
+    prompts_per_request: int = p.PROMPTS_PER_REQUEST,
+) -> Iterator[dict]:
+    """
+    Simplify and score a stream of records, yielding each one as soon as it is done.
+
+    The records are read lazily and at most `concurrency` requests (of `prompts_per_request`
+    records, if the LLM API supports batches) are in flight, so memory use does not depend on
+    the number of records. Each record gets the same columns as in process_df_w_llm, empty if
+    the text is missing or could not be simplified. The records come out in completion order.
+    """
+    header = model + ("_w_rules" if use_rules else "")
+    size = prompts_per_request if prompts_per_request > 1 and supports_batch() else 1
+
+    def set_results(batch: list[dict], results: dict, scores: dict) -> list[dict]:
+        for i, record in enumerate(batch):
+            fre, wstf = scores.get(i, (None, None))
+            record[f"Leichte Sprache {header}"] = results.get(i)
+            record[f"{header} FRE Score"] = None if fre is None else float(fre)
+            record[f"{header} WSTF Score"] = None if wstf is None else float(wstf)
+        return batch
+
+    def simplify_records(batch: list[dict]) -> list[dict]:
+        texts = [record.get(column) for record in batch]
+        items = [(i, text) for i, text in enumerate(texts) if isinstance(text, str) and text]
+        results = {}
+        if len(items) > 1:
+            results = dict(simplify_text_batch(items, model, use_rules, p.TOP_K, p.TOP_P, p.TEMP))
+        for i, text in items:
+            if results.get(i) is None:
+                try:
+                    results[i] = simplify_row(text, model, use_rules, retries)
+                except Exception as e:
+                    logger.error(f"Record failed: {e}")
+
+        done = [i for i, _ in items if results.get(i) is not None]
+        fre_scores, wstf_scores = score_texts([results[i] for i in done])
+        scores = {i: (fre, wstf) for i, fre, wstf in zip(done, fre_scores, wstf_scores)}
+        return set_results(batch, results, scores)
+
+    def process_batch(batch: list[dict]) -> list[dict]:
+        try:
+            return simplify_records(batch)
+        except Exception as e:
+            # The records are passed on without results, so none of them goes missing
+            logger.error(f"Batch of records failed: {e}")
+            return set_results(batch, {}, {})
+
+    for _, batch in bounded_map(process_batch, batched(records, size), workers=concurrency):
+        yield from batch
+
+
 def main(
     file_path: str,
     model: str,
@@ -111,29 +404,103 @@ def main(
     save_file: bool = True,
     plot: bool = True,
     verbose: bool = True,
+    concurrency: int = p.NUM_PARALLEL,
+    resume: bool = False,
+    workers: int = 1,
+    batch_size: int | None = None,
+    output_format: str | None = None,
+    prompts_per_request: int = p.PROMPTS_PER_REQUEST,
+    stream_format: str = "jsonl",
+    near_duplicates: float | None = None,
 ):
-    """Main function to process the dataset with Leichte Sprache model."""
+    """
+    Main function to process the dataset with Leichte Sprache model.
+
+    The dataset can be a CSV, Parquet or Arrow (Feather) file. The processed dataset is saved
+    in the same format, unless another `output_format` (file extension) is given.
+
+    Finished rows are checkpointed next to the output file (*_checkpoint.jsonl), so an
+    interrupted run can be continued with `resume`. If `batch_size` is given, the dataset is
+    read and processed in batches of rows and the output file is written as it goes. Near
+    duplicates (see process_df_w_llm) are then found within each batch.
+
+    With `file_path` "-", records are read from stdin and written to stdout as they are done
+    (JSON lines or CSV, see `stream_format`), without files, checkpoints or plots.
+    """
+
+    if file_path == "-":
+        records = process_records(
+            read_records(sys.stdin, stream_format),
+            model,
+            use_rules,
+            column,
+            concurrency,
+            prompts_per_request=prompts_per_request,
+        )
+        n = write_records(records, sys.stdout, stream_format)
+        logger.info(f"Processed {n} records")
+        return
 
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"The file {file_path} does not exist.")
 
-    df = load_dataset(file_path)
+    suffix = "_llm_processed"
+    if use_rules:
+        suffix += "_w_rules"
+    extension = f".{output_format}" if output_format else None
+    output_file = get_new_file_path(file_path, suffix=suffix, extension=extension)
+    checkpoint_file = get_new_file_path(output_file, suffix="_checkpoint", extension=".jsonl")
+    logger.info(f"Saving finished rows to checkpoint {checkpoint_file}")
+
+    if batch_size:
+        averages = process_in_batches(
+            file_path,
+            output_file if save_file else None,
+            batch_size,
+            model,
+            use_rules,
+            column,
+            concurrency=concurrency,
+            checkpoint_file=checkpoint_file,
+            resume=resume,
+            workers=workers,
+            prompts_per_request=prompts_per_request,
+            near_duplicates=near_duplicates,
+        )
+        if verbose and averages is not None:
+            print(averages.to_markdown())
+        if not save_file:
+            return
+        logger.info(f"Saved processed dataset to {output_file}")
+        df = read_table(output_file, columns=lambda column: "Score" in column)
 
-    if column not in df.columns:
-        raise ValueError(f"Column '{column}' does not exist in the dataset.")
+    else:
+        df = load_dataset(file_path)
 
-    df = process_df_w_llm(df, model, use_rules, column_choice=column, verbose=verbose)
+        if column not in df.columns:
+            raise ValueError(f"Column '{column}' does not exist in the dataset.")
 
-    output_file = None
-    if save_file:
-        suffix = "_llm_processed"
-        if use_rules:
-            suffix += "_w_rules"
-        output_file = get_new_file_path(file_path, suffix=suffix)
-        df.to_csv(output_file, index=False, encoding="utf-8")
-        logger.info(f"Saved processed dataset to {output_file}")
+        df = process_df_w_llm(
+            df,
+            model,
+            use_rules,
+            column_choice=column,
+            verbose=verbose,
+            concurrency=concurrency,
+            checkpoint_file=checkpoint_file,
+            resume=resume,
+            workers=workers,
+            prompts_per_request=prompts_per_request,
+            near_duplicates=near_duplicates,
+        )
 
-    if plot:
+        if save_file:
+            write_table(df, output_file)
+            logger.info(f"Saved processed dataset to {output_file}")
+        else:
+            output_file = None
+
+    if plot and not df.empty:
         show_graph = True if df.shape[0] < 100 else False
         plot_scores(
             df, score_name="FRE", save_file=True, orig_file=output_file, show_graph=show_graph
@@ -145,7 +512,9 @@ def main(
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process a dataset with Leichte Sprache model.")
-    parser.add_argument("file_path", type=str, help="Path to the input CSV file.")
+    parser.add_argument(
+        "file_path", type=str, help="Path to the input CSV, Parquet or Arrow file, or - for stdin."
+    )
     parser.add_argument(
         "-m", "--model", type=str, default=p.MODEL, help="Model to use for processing."
     )
@@ -160,8 +529,87 @@ if __name__ == "__main__":
         help="Name of the column containing the text to process.",
     )
 
+    parser.add_argument(
+        "-p",
+        "--parallel",
+        type=int,
+        default=p.NUM_PARALLEL,
+        help="Number of concurrent requests to the LLM server (see OLLAMA_NUM_PARALLEL).",
+    )
+
+    parser.add_argument(
+        "--cache",
+        type=str,
+        default=p.CACHE_PATH,
+        help="Path to the LLM response cache. Defaults to LS_CACHE_PATH (empty = no cache).",
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip rows already processed with the same settings in a previous run.",
+    )
+
+    parser.add_argument(
+        "-w", "--workers", type=int, default=1, help="Number of processes used for scoring."
+    )
+
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=None,
+        help="Stream the dataset in batches of this many rows instead of loading it at once.",
+    )
+
+    parser.add_argument(
+        "--prompts-per-request",
+        type=int,
+        default=p.PROMPTS_PER_REQUEST,
+        help="Rows sent with one request, if the LLM API supports batches (LS_LLM_API=openai).",
+    )
+
+    parser.add_argument(
+        "--near-duplicates",
+        type=float,
+        nargs="?",
+        const=p.NEAR_DUPLICATE_THRESHOLD,
+        default=None,
+        metavar="THRESHOLD",
+        help="Generate once per group of near-identical texts, with a minimum similarity (0-1).",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--output-format",
+        choices=["csv", "parquet", "feather"],
+        default=None,
+        help="Format of the processed dataset. Defaults to the format of the input file.",
+    )
+
+    parser.add_argument(
+        "--stream-format",
+        choices=RECORD_FORMATS,
+        default="jsonl",
+        help="Format of the records on stdin and stdout (with file_path -).",
+    )
+
     args = parser.parse_args()
 
     use_rules = args.use_rules or p.USE_RULES
-
-    main(args.file_path, args.model, use_rules, args.column)
+    configure_cache(args.cache)
+
+    main(
+        args.file_path,
+        args.model,
+        use_rules,
+        args.column,
+        concurrency=args.parallel,
+        resume=args.resume,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        output_format=args.output_format,
+        prompts_per_request=args.prompts_per_request,
+        stream_format=args.stream_format,
+        near_duplicates=args.near_duplicates,
+    )
@@ -0,0 +1,113 @@
+import logging, os
+import argparse
+import time
+import pandas as pd
+from leichtesprache.core import PROMPT_LAYOUTS, create_prompt, create_system_prompt
+from leichtesprache.llm import llm_generate, load_model
+from leichtesprache.tools.process_dataset import load_dataset
+import leichtesprache.parameters as p
+
+logging.basicConfig(format=os.getenv("LOG_FORMAT", "%(asctime)s [%(levelname)s] %(message)s"))
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
+
+# %% ============== Compare Prompt Layouts ==================================
+
+
+def measure_layout(texts: list[str], model: str, layout: str, use_rules: bool = False) -> dict:
+    """
+    Send the texts one after another in a prompt layout and summarize the prompt evaluation.
+
+    The requests go straight to the LLM server (not through the response cache) and are sent
+    sequentially, so each one can reuse what the server cached from the previous one. Ollama
+    only counts the prompt tokens it actually evaluated in prompt_eval_count, so a reused
+    prefix shows up in both the token count and prompt_eval_duration.
+    """
+    system = create_system_prompt(layout)
+    counts, durations, totals, failed = [], [], [], 0
+    for text in texts:
+        info = {}
+        prompt = create_prompt(text, use_rules, layout=layout)
+        start = time.perf_counter()
+        response = llm_generate(prompt, model, p.TOP_K, p.TOP_P, p.TEMP, info, system)
+        if response is None:
+            failed += 1
+            continue
+        totals.append(time.perf_counter() - start)
+        counts.append(info.get("prompt_eval_count"))
+        # Only reported by Ollama
+        durations.append(info.get("prompt_eval_duration"))
+
+    counts = pd.Series(counts, dtype=float).dropna()
+    durations = pd.Series(durations, dtype=float).dropna() / 1e6
+    return {
+        "Layout": layout,
+        "Requests": len(texts),
+        "Failed": failed,
+        "Prompt tokens evaluated": counts.mean(),
+        "Prompt eval (ms)": durations.mean(),
+        "Prompt eval p50 (ms)": durations.median(),
+        "Request (ms)": pd.Series(totals, dtype=float).mean() * 1000,
+    }
+
+
+def main(
+    file_path: str,
+    model: str = p.MODEL,
+    layouts: list[str] = PROMPT_LAYOUTS,
+    column: str = "Original",
+    rows: int = 20,
+    use_rules: bool = False,
+) -> pd.DataFrame:
+    """
+    Compare the prompt evaluation time of the prompt layouts on the first rows of a dataset.
+
+    The model is loaded first, so the load time does not count towards the first layout.
+    """
+    df = load_dataset(file_path, verbose=False)
+    if column not in df.columns:
+        raise ValueError(f"Column '{column}' does not exist in the dataset.")
+    texts = df[column].dropna().head(rows).to_list()
+
+    load_model(model)
+    results = []
+    for layout in layouts:
+        logger.info(f"Measuring layout '{layout}' with {len(texts)} requests to {model}")
+        results.append(measure_layout(texts, model, layout, use_rules))
+
+    summary = pd.DataFrame(results).round(1)
+    print(summary.to_markdown(index=False))
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the prompt evaluation time of the prompt layouts."
+    )
+    parser.add_argument(
+        "file_path", type=str, help="Path to the input CSV, Parquet or Arrow file."
+    )
+    parser.add_argument("-m", "--model", type=str, default=p.MODEL, help="Model to use.")
+    parser.add_argument(
+        "-l",
+        "--layouts",
+        choices=PROMPT_LAYOUTS,
+        nargs="+",
+        default=PROMPT_LAYOUTS,
+        help="Prompt layouts to compare.",
+    )
+    parser.add_argument(
+        "-c",
+        "--column",
+        type=str,
+        default="Original",
+        help="Name of the column containing the texts.",
+    )
+    parser.add_argument(
+        "-n", "--rows", type=int, default=20, help="Number of rows (requests) per layout."
+    )
+    parser.add_argument("-r", "--use_rules", action="store_true", help="Use rules for processing.")
+
+    args = parser.parse_args()
+
+    main(args.file_path, args.model, args.layouts, args.column, args.rows, args.use_rules)
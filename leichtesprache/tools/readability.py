@@ -0,0 +1,148 @@
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Iterable, Sequence
+import numpy as np
+from pyphen import Pyphen
+from leichtesprache.parameters import LANGUAGE
+
+# Readability scoring engine. Each text is tokenized once into the counts needed by the
+# Flesch Reading Ease (FRE) and Wiener Sachtextformel (WSTF) scores, which are then computed
+# for all texts at once with NumPy. Counting follows textstat's definitions, so the scores
+# are the same as textstat.flesch_reading_ease and textstat.wiener_sachtextformel(text, 1)
+# (for languages without a pronouncing dictionary, i.e. all but English).
+
+# FRE constants (base, sentence length weight, syllables per word weight)
+FRE_CONSTANTS = {
+    "de": (180.0, 1.0, 58.5),  # Toni Amstad
+    "en": (206.835, 1.015, 84.6),
+    "es": (206.84, 1.02, 60.0),
+    "fr": (207.0, 1.015, 73.6),
+    "it": (217.0, 1.3, 60.0),
+    "nl": (206.835, 0.93, 77.0),
+}
+
+RE_SENTENCE = re.compile(r"\b[^.!?]+[.!?]*")
+RE_NONCONTRACTION_APOSTROPHE = re.compile(r"\'(?!(?:[tsd]|ve|ll|re))")
+RE_PUNCTUATION = re.compile(r"[^\w\s\']")
+LONG_WORD_THRESHOLD = 6
+
+# Columns of the counts array
+WORDS, SENTENCES, SYLLABLES, POLYSYLLABLES, MONOSYLLABLES, LONG_WORDS = range(6)
+N_COUNTS = 6
+
+
+@lru_cache(maxsize=1)
+def get_hyphenator(lang: str = LANGUAGE) -> Pyphen:
+    return Pyphen(lang=lang)
+
+
+@lru_cache(maxsize=2**18)
+def count_syllables(word: str) -> int:
+    """Estimate the number of syllables of a (lowercase) word from its hyphenation points."""
+    return len(get_hyphenator().positions(word)) + 1
+
+
+def list_words(text: str) -> list[str]:
+    text = RE_NONCONTRACTION_APOSTROPHE.sub("", text)
+    return RE_PUNCTUATION.sub("", text).split()
+
+
+def count_sentences(text: str) -> int:
+    """Count sentences, ignoring fragments of two words or less (e.g. "z. B.")."""
+    if not text:
+        return 0
+    sentences = RE_SENTENCE.findall(text)
+    ignored = sum(1 for sentence in sentences if len(list_words(sentence)) <= 2)
+    return max(1, len(sentences) - ignored)
+
+
+def text_counts(text: str) -> tuple[int, ...]:
+    """Return the counts of a text in the order of the counts array columns."""
+    words = list_words(text)
+    syllables = [count_syllables(word.lower()) for word in words]
+    return (
+        len(words),
+        count_sentences(text),
+        sum(syllables),
+        sum(1 for s in syllables if s >= 3),
+        sum(1 for s in syllables if s == 1),
+        sum(1 for word in words if len(word.replace("'", "")) > LONG_WORD_THRESHOLD),
+    )
+
+
+def count_texts(texts: Iterable[str]) -> np.ndarray:
+    """
+    Tokenize each text once and collect its counts.
+
+    Returns:
+        np.ndarray: Array of shape (n_texts, N_COUNTS). Rows of missing (non-string) texts are NaN.
+    """
+    rows = [text_counts(text) if isinstance(text, str) else (np.nan,) * N_COUNTS for text in texts]
+    return np.array(rows, dtype=float).reshape(-1, N_COUNTS)
+
+
+def fre_scores(counts: np.ndarray, lang: str = LANGUAGE) -> np.ndarray:
+    """Flesch Reading Ease scores from a counts array (0 for texts without words)."""
+    base, sentence_weight, syllable_weight = FRE_CONSTANTS.get(lang, FRE_CONSTANTS["en"])
+    words, sentences = counts[:, WORDS], counts[:, SENTENCES]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sentence_length = np.where(sentences > 0, words / sentences, 0.0)
+        syllables_per_word = np.where(words > 0, counts[:, SYLLABLES] / words, 0.0)
+    scores = base - sentence_weight * sentence_length - syllable_weight * syllables_per_word
+    scores = np.where((sentence_length == 0) | (syllables_per_word == 0), 0.0, scores)
+    return np.where(np.isnan(words), np.nan, scores)
+
+
+def wstf_scores(counts: np.ndarray) -> np.ndarray:
+    """First Wiener Sachtextformel scores from a counts array (0 for texts without words)."""
+    words, sentences = counts[:, WORDS], counts[:, SENTENCES]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ms = 100 * counts[:, POLYSYLLABLES] / words
+        sl = np.where(sentences > 0, words / sentences, 0.0)
+        iw = 100 * counts[:, LONG_WORDS] / words
+        es = 100 * counts[:, MONOSYLLABLES] / words
+    scores = 0.1935 * ms + 0.1672 * sl + 0.1297 * iw - 0.0327 * es - 0.875
+    scores = np.where(words == 0, 0.0, scores)
+    return np.where(np.isnan(words), np.nan, scores)
+
+
+def count_texts_parallel(
+    texts: Sequence[str], workers: int = 1, chunk_size: int = 1000
+) -> np.ndarray:
+    """
+    Same as count_texts, but tokenizes the texts in a pool of `workers` processes.
+
+    Texts are dispatched in chunks of `chunk_size`, so that each worker receives few large
+    messages, and the counts are returned in the order of the texts.
+    """
+    texts = list(texts)
+    if workers <= 1 or len(texts) <= chunk_size:
+        return count_texts(texts)
+    chunks = [texts[i : i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return np.concatenate(list(executor.map(count_texts, chunks)))
+
+
+def score_texts(
+    texts: Iterable[str], workers: int = 1, chunk_size: int = 1000
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate the FRE and WSTF scores of many texts.
+
+    The scores are clipped as in the rest of the tools: FRE to a minimum of 0 and WSTF to a
+    minimum of 4.
+
+    Args:
+        texts (Iterable[str]): The texts to score. Missing values get NaN scores.
+        workers (int, optional): Number of processes used for tokenization. Defaults to 1.
+        chunk_size (int, optional): Number of texts sent to a worker at once. Defaults to 1000.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The FRE and the WSTF scores.
+    """
+    if workers > 1:
+        counts = count_texts_parallel(list(texts), workers, chunk_size)
+    else:
+        counts = count_texts(texts)
+    return np.maximum(fre_scores(counts), 0), np.maximum(wstf_scores(counts), 4)
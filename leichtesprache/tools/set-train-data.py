@@ -2,7 +2,10 @@ import logging, os
 import pandas as pd
 import json
 from typing import List, Dict
+from leichtesprache.dedup import NearDuplicateIndex, find_near_duplicates
+from leichtesprache.parameters import NEAR_DUPLICATE_THRESHOLD
 from leichtesprache.prompts import PROMPT_TEMPLATE_BASIC
+from leichtesprache.utils import TableWriter, read_batches, read_table
 import argparse
 
 logging.basicConfig(format=os.getenv("LOG_FORMAT", "%(asctime)s [%(levelname)s] %(message)s"))
@@ -12,13 +15,15 @@ logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Process a dataset for training and testing.")
-    parser.add_argument('--file-name', type=str, default='dataset.csv', help='Dataset CSV file.')
+    parser.add_argument('--file-name', type=str, default='dataset.csv', help='Dataset CSV, Parquet or Arrow file.')
     parser.add_argument('--data-path', type=str, default='data', help='Base directory for data files.')
     parser.add_argument('--train-fraction', type=float, default=0.8, help='Fraction of data to be used for training.')
     parser.add_argument('--random-seed', type=int, default=42, help='Random seed for reproducibility.')
     parser.add_argument('--input-header', type=str, default='input', help='Header name for input column.')
     parser.add_argument('--target-header', type=str, default='output', help='Header name for target (output) column.')
     parser.add_argument('--format', choices=['chatml', 'alpaca'], default='chatml', help="Output format: chatml or alpaca.")
+    parser.add_argument('--batch-size', type=int, default=None, help='Stream the dataset in batches of this many rows instead of loading it at once.')
+    parser.add_argument('--near-duplicates', type=float, nargs='?', const=NEAR_DUPLICATE_THRESHOLD, default=None, metavar='THRESHOLD', help='Keep near-identical inputs in the same set, with a minimum similarity (0-1) as threshold.')
     parser.add_argument('--verbose', action='store_true', help='Increase output verbosity.')
     return parser.parse_args()
 
@@ -30,16 +35,35 @@ def load_and_split_data(
     input_header: str,
     target_header: str,
     verbose: bool = False,
+    near_duplicates: float | None = None,
 ) -> tuple[pd.DataFrame, pd.DataFrame]:
-    """Load cleaned and analysed dataset from file path."""
+    """
+    Load cleaned and analysed dataset from file path and split it into train and test set.
+
+    With `near_duplicates` (a similarity threshold), near-identical inputs are grouped (see
+    dedup.NearDuplicateIndex) and the groups are sampled instead of the rows, so that no
+    near duplicate of a test sample ends up in the train set.
+    """
 
     logger.info(f"Loading dataset from {file_path}")
-    df = pd.read_csv(file_path, usecols=[0, 1], names=[input_header, target_header], header=0)
+    df = read_table(file_path, columns=[0, 1])
+    df.columns = [input_header, target_header]
     if verbose:
         print(df.info(verbose=False))
     print(f"Number of samples: {len(df)}")
-    train_df = df.sample(frac=train_fraction, random_state=random_seed)
-    test_df = df.drop(train_df.index)
+    if near_duplicates:
+        clusters = pd.Series(
+            find_near_duplicates(df[input_header].to_list(), near_duplicates), index=df.index
+        )
+        print(f"Groups of near-identical samples: {clusters.nunique()}")
+        train_clusters = clusters.drop_duplicates().sample(
+            frac=train_fraction, random_state=random_seed
+        )
+        is_train = clusters.isin(train_clusters)
+        train_df, test_df = df[is_train], df[~is_train]
+    else:
+        train_df = df.sample(frac=train_fraction, random_state=random_seed)
+        test_df = df.drop(train_df.index)
     # Show the sizes of the datasets
     print(f"Train set size: {len(train_df)}")
     print(f"Test set size: {len(test_df)}")
@@ -50,6 +74,79 @@ def load_and_split_data(
     return train_df, test_df
 
 
+def split_data_in_batches(
+    file_path: str,
+    data_path: str,
+    train_fraction: float,
+    random_seed: int,
+    input_header: str,
+    target_header: str,
+    output_format: str,
+    batch_size: int,
+    near_duplicates: float | None = None,
+):
+    """
+    Split and format a dataset batch by batch, writing the output files as it goes.
+
+    Each row is assigned to the train or test set by a seeded hash of its content instead of
+    random sampling, so the split is reproducible and independent of the batch size. The
+    train fraction is met approximately. With `near_duplicates`, rows whose input is nearly
+    the same as the one of an earlier row go to the set of that row.
+    """
+    logger.info(f"Streaming dataset from {file_path} in batches of {batch_size} rows")
+    if output_format not in ('chatml', 'alpaca'):
+        raise ValueError("Invalid output format. Choose 'chatml' or 'alpaca'.")
+    format_dataset = (
+        format_dataframe_to_chatml_dataset
+        if output_format == 'chatml'
+        else format_dataframe_to_alpaca_dataset
+    )
+    extension = "jsonl" if output_format == 'chatml' else "json"
+    hash_key = f"{random_seed:016d}"[-16:]
+    index = NearDuplicateIndex(near_duplicates) if near_duplicates else None
+    cluster_is_train = {}
+
+    sizes = {"train": 0, "test": 0}
+    files = {
+        name: open(os.path.join(data_path, f"{name}.{extension}"), 'w', encoding='utf-8')
+        for name in sizes
+    }
+    csv_writers = {name: TableWriter(os.path.join(data_path, f"{name}.csv")) for name in sizes}
+    try:
+        for df in read_batches(file_path, batch_size, columns=[0, 1]):
+            df.columns = [input_header, target_header]
+            hashes = pd.util.hash_pandas_object(df, index=False, hash_key=hash_key).to_numpy()
+            is_train = hashes < train_fraction * 2**64
+            if index:
+                start = index.size
+                for i, cluster in enumerate(index.add(df[input_header].to_list())):
+                    if cluster == start + i:
+                        cluster_is_train[cluster] = is_train[i]
+                    else:
+                        is_train[i] = cluster_is_train[cluster]
+            for name, split_df in (("train", df[is_train]), ("test", df[~is_train])):
+                csv_writers[name].write(split_df)
+                for item in format_dataset(split_df, input_header, target_header):
+                    if output_format == 'chatml':
+                        json.dump(item, files[name], ensure_ascii=False)
+                        files[name].write('\n')
+                    else:
+                        files[name].write('[\n' if sizes[name] == 0 else ',\n')
+                        files[name].write(json.dumps(item, indent=4))
+                    sizes[name] += 1
+        if output_format == 'alpaca':
+            for name, f in files.items():
+                f.write('\n]' if sizes[name] else '[]')
+    finally:
+        for f in files.values():
+            f.close()
+        for writer in csv_writers.values():
+            writer.close()
+
+    print(f"Train set size: {sizes['train']}")
+    print(f"Test set size: {sizes['test']}")
+
+
 def format_dataframe_to_chatml_dataset(
     df: pd.DataFrame, input_header: str, target_header: str
 ) -> List[Dict]:
@@ -119,14 +216,37 @@ def main(
     target_header: str,
     output_format: str,
     verbose: bool = False,
+    batch_size: int | None = None,
+    near_duplicates: float | None = None,
 ):
 
     file_path = os.path.join(data_path, file_name)
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found at {file_path}")
 
+    if batch_size:
+        split_data_in_batches(
+            file_path,
+            data_path,
+            train_fraction,
+            random_seed,
+            input_header,
+            target_header,
+            output_format,
+            batch_size,
+            near_duplicates,
+        )
+        logger.info("Data preprocessing completed.")
+        return
+
     train_df, test_df = load_and_split_data(
-        file_path, train_fraction, random_seed, input_header, target_header, verbose=verbose
+        file_path,
+        train_fraction,
+        random_seed,
+        input_header,
+        target_header,
+        verbose=verbose,
+        near_duplicates=near_duplicates,
     )
 
     logger.info("Saving train and test datasets to CSV files...")
@@ -168,4 +288,6 @@ if __name__ == "__main__":
         args.target_header,
         args.format,
         args.verbose,
+        args.batch_size,
+        args.near_duplicates,
     )
@@ -1,4 +1,15 @@
-import os
+import logging, os, time
+import csv, json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Callable, Iterable, Iterator, TextIO, TypeVar
+
+logging.basicConfig(format=os.getenv("LOG_FORMAT", "%(asctime)s [%(levelname)s] %(message)s"))
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
+
+S = TypeVar("S")
+T = TypeVar("T")
 
 
 def get_new_file_path(
@@ -19,3 +30,339 @@ def get_new_file_path(
     file_name, orig_ext = os.path.splitext(file_base)
     ext = extension if extension else orig_ext
     return os.path.join(dir_name, file_name + suffix + ext)
+
+
+def call_with_retry(
+    func: Callable[..., T], *args, retries: int = 3, backoff: float = 1.0, **kwargs
+) -> T:
+    """
+    Calls a function and retries it with exponential backoff if it fails.
+
+    A call is considered failed if it raises an exception or returns None (the LLM layer logs
+    errors and returns None instead of raising).
+
+    Args:
+        func (Callable): The function to call.
+        retries (int, optional): Number of retries after the first attempt. Defaults to 3.
+        backoff (float, optional): Initial waiting time in seconds, doubled on every retry. Defaults to 1.0.
+
+    Returns:
+        The result of the first successful call.
+
+    Raises:
+        RuntimeError: If all attempts fail. The last exception, if any, is chained.
+    """
+    last_exc = None
+    for attempt in range(retries + 1):
+        try:
+            result = func(*args, **kwargs)
+            if result is not None:
+                return result
+            last_exc = None
+        except Exception as e:
+            last_exc = e
+        if attempt < retries:
+            delay = backoff * 2**attempt
+            logger.warning(f"Attempt {attempt + 1} failed. Retrying in {delay:.1f}s")
+            time.sleep(delay)
+    raise RuntimeError(f"All {retries + 1} attempts failed") from last_exc
+
+
+def bounded_map(
+    func: Callable[[S], T], items: Iterable[S], workers: int = 4, max_pending: int | None = None
+) -> Iterator[tuple[int, T | Exception]]:
+    """
+    Applies a function concurrently to the items of an iterable using a thread pool.
+
+    Items are consumed lazily: at most `max_pending` tasks are queued or running at any time,
+    so arbitrarily long iterables can be processed with bounded memory.
+
+    Args:
+        func (Callable): The function to apply to each item.
+        items (Iterable): The items to process.
+        workers (int, optional): Number of concurrent threads. Defaults to 4.
+        max_pending (int | None, optional): Maximum number of submitted but unfinished tasks. Defaults to twice the number of workers.
+
+    Yields:
+        tuple[int, Any]: The position of the item in `items` and the result of `func`, in completion order.
+            If `func` raised, the exception is yielded instead of the result.
+    """
+    workers = max(1, workers)
+    max_pending = max(workers, max_pending or 2 * workers)
+    items_iter = enumerate(items)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    position, item = next(items_iter)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[executor.submit(func, item)] = position
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                position = pending.pop(future)
+                exc = future.exception()
+                yield position, exc if exc is not None else future.result()
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """Split an iterable lazily into lists of `size` items (the last one may be shorter)."""
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+# ============== Tables (CSV, Parquet, Arrow) ================================
+
+TABLE_FORMATS = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".feather": "arrow",
+    ".arrow": "arrow",
+}
+
+
+def get_table_format(file_path: str) -> str:
+    """Returns the table format of a file ('csv', 'parquet' or 'arrow') from its extension."""
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext not in TABLE_FORMATS:
+        raise ValueError(f"Unsupported file extension '{ext}'. Use one of {list(TABLE_FORMATS)}")
+    return TABLE_FORMATS[ext]
+
+
+def get_table_columns(file_path: str) -> list[str]:
+    """Returns the column names of a table file without reading its data."""
+    table_format = get_table_format(file_path)
+    if table_format == "csv":
+        import pandas as pd
+
+        return pd.read_csv(file_path, nrows=0).columns.to_list()
+    elif table_format == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.read_schema(file_path).names
+    else:
+        import pyarrow.feather as feather
+
+        return feather.read_table(file_path, memory_map=True).column_names
+
+
+def select_columns(names: list[str], columns: list | Callable | None) -> list[str] | None:
+    """Resolves a column selection given as names, positions or a predicate to column names."""
+    if columns is None:
+        return None
+    if callable(columns):
+        return [name for name in names if columns(name)]
+    return [names[column] if isinstance(column, int) else column for column in columns]
+
+
+def read_table(file_path: str, columns: list | Callable | None = None, memory_map: bool = True):
+    """
+    Reads a CSV, Parquet or Arrow (Feather) file into a DataFrame, chosen by file extension.
+
+    Args:
+        file_path (str): Path to the file.
+        columns (list | Callable | None, optional): Columns to read, as names, positions or a predicate on the name. Defaults to all.
+        memory_map (bool, optional): Memory-map Parquet and Arrow files instead of reading them into buffers. Defaults to True.
+
+    Returns:
+        pd.DataFrame: The data.
+    """
+    import pandas as pd
+
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found at {file_path}")
+
+    table_format = get_table_format(file_path)
+    if table_format == "csv":
+        return pd.read_csv(file_path, usecols=columns)
+
+    columns = select_columns(get_table_columns(file_path), columns)
+    if table_format == "parquet":
+        return pd.read_parquet(file_path, columns=columns, memory_map=memory_map)
+    else:
+        import pyarrow.feather as feather
+
+        return feather.read_table(file_path, columns=columns, memory_map=memory_map).to_pandas()
+
+
+def write_table(df, file_path: str):
+    """Writes a DataFrame to a CSV, Parquet or Arrow (Feather) file, chosen by file extension."""
+    table_format = get_table_format(file_path)
+    if table_format == "csv":
+        df.to_csv(file_path, index=False, encoding="utf-8")
+    elif table_format == "parquet":
+        df.to_parquet(file_path, index=False)
+    else:
+        df.reset_index(drop=True).to_feather(file_path)
+
+
+def read_batches(
+    file_path: str, batch_size: int = 10_000, columns: list | Callable | None = None
+) -> Iterator:
+    """
+    Reads a CSV, Parquet or Arrow file in batches of rows, so that files larger than memory
+    can be processed.
+
+    Args:
+        file_path (str): Path to the file.
+        batch_size (int, optional): Number of rows per batch. Defaults to 10000.
+        columns (list | Callable | None, optional): Columns to read, as names, positions or a predicate on the name. Defaults to all.
+
+    Yields:
+        pd.DataFrame: The batches in file order. Their index continues across batches.
+    """
+    import pandas as pd
+
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found at {file_path}")
+
+    table_format = get_table_format(file_path)
+    if table_format == "csv":
+        with pd.read_csv(file_path, chunksize=batch_size, usecols=columns) as reader:
+            yield from reader
+        return
+
+    columns = select_columns(get_table_columns(file_path), columns)
+    if table_format == "parquet":
+        import pyarrow.parquet as pq
+
+        record_batches = pq.ParquetFile(file_path, memory_map=True).iter_batches(
+            batch_size=batch_size, columns=columns
+        )
+    else:
+        import pyarrow.feather as feather
+
+        table = feather.read_table(file_path, columns=columns, memory_map=True)
+        record_batches = table.to_batches(max_chunksize=batch_size)
+
+    start = 0
+    for record_batch in record_batches:
+        df = record_batch.to_pandas()
+        df.index = pd.RangeIndex(start, start + len(df))
+        start += len(df)
+        yield df
+
+
+class TableWriter:
+    """
+    Writes batches of rows to a CSV, Parquet or Arrow file, chosen by file extension.
+
+    All batches must have the same columns. Use it as a context manager:
+
+        with TableWriter("data_processed.parquet") as writer:
+            for df in batches:
+                writer.write(df)
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.format = get_table_format(file_path)
+        self.rows = 0
+        self._started = False
+        self._writer = None
+        self._schema = None
+
+    def write(self, df):
+        if self.format == "csv":
+            df.to_csv(
+                self.file_path,
+                mode="a" if self._started else "w",
+                header=not self._started,
+                index=False,
+                encoding="utf-8",
+            )
+        else:
+            import pyarrow as pa
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                if self.format == "parquet":
+                    import pyarrow.parquet as pq
+
+                    self._writer = pq.ParquetWriter(self.file_path, table.schema)
+                else:
+                    self._writer = pa.ipc.new_file(self.file_path, table.schema)
+            # Make the types of later batches match the first one (e.g. int and float columns)
+            self._writer.write_table(table.cast(self._schema, safe=False))
+        self._started = True
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ============== Records (JSONL, CSV) =========================================
+
+RECORD_FORMATS = ["jsonl", "csv"]
+
+
+def read_records(stream: TextIO, record_format: str = "jsonl") -> Iterator[dict]:
+    """
+    Reads records one at a time from a stream of JSON lines or CSV rows (with header).
+
+    Args:
+        stream (TextIO): The stream to read, e.g. sys.stdin.
+        record_format (str, optional): "jsonl" or "csv". Defaults to "jsonl".
+
+    Yields:
+        dict: The records in stream order.
+    """
+    if record_format == "csv":
+        yield from csv.DictReader(stream)
+        return
+    for n, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON in line {n}: {e}") from e
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {n} is not a JSON object.")
+        yield record
+
+
+def write_records(records: Iterable[dict], stream: TextIO, record_format: str = "jsonl") -> int:
+    """
+    Writes records to a stream as JSON lines or CSV rows, flushing after each one, so that the
+    next step of a pipe can start on them right away.
+
+    The CSV header is taken from the first record.
+
+    Returns:
+        int: The number of records written.
+    """
+    writer = None
+    n = 0
+    for record in records:
+        if record_format == "csv":
+            if writer is None:
+                writer = csv.DictWriter(
+                    stream, fieldnames=list(record), extrasaction="ignore", lineterminator="\n"
+                )
+                writer.writeheader()
+            writer.writerow(record)
+        else:
+            stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        stream.flush()
+        n += 1
+    return n